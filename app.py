@@ -1,22 +1,16 @@
-from flask import Flask, request, jsonify, render_template
-import importlib
+from flask import Flask, Response, request, jsonify, render_template
+import json
 import os
+from plugin_registry import get_available_tools, get_registry, start_watcher
+import dispatcher
 
 app = Flask(__name__)
 
-PLUGINS_DIR = "plugins"
-
-def get_available_tools():
-    return [f.replace(".py", "") for f in os.listdir(PLUGINS_DIR) if f.endswith(".py") and f != "__init__.py"]
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
 
 def run_tool(tool_name, params):
-    try:
-        module = importlib.import_module(f"{PLUGINS_DIR}.{tool_name}")
-        return module.run(params)
-    except ModuleNotFoundError:
-        return {"error": f"Tool '{tool_name}' not found."}
-    except Exception as e:
-        return {"error": str(e)}
+    # Shared with the MCP server so per-tool concurrency limits and async plugins apply here too
+    return dispatcher.run_tool_sync(tool_name, params)
 
 @app.route("/")
 def index():
@@ -27,11 +21,60 @@ def index():
         "available_tools": get_available_tools()
     })
 
+@app.route("/stats")
+def stats():
+    plugins = {name: entry["module"].stats() for name, entry in get_registry().items()
+               if entry["module"] is not None and callable(getattr(entry["module"], "stats", None))}
+    return jsonify({"dispatcher": dispatcher.stats(), "plugins": plugins})
+
+def _sse_event(item):
+    event = "chunk" if "chunk" in item else "result"
+    return f"event: {event}\ndata: {json.dumps(item)}\n\n"
+
+def _emit(events, encode):
+    # Closing events on disconnect stops the producer instead of letting it run to completion
+    try:
+        for item in events:
+            yield encode(item)
+    finally:
+        events.close()
+
 @app.route("/run/<tool_name>", methods=["POST"])
 def run(tool_name):
     params = request.get_json(force=True)
+
+    # Opt-in streaming: partial results are flushed as the plugin produces them
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        events = dispatcher.iterate_sync(dispatcher.stream_tool(tool_name, params))
+        return Response(_emit(events, _sse_event), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    if request.args.get("stream") == "1":
+        # NDJSON is the export format: tools may stream their whole result set, ending with a summary
+        events = dispatcher.iterate_sync(dispatcher.stream_tool(tool_name, params, export=True))
+        return Response(_emit(events, lambda item: json.dumps(item) + "\n"), mimetype="application/x-ndjson")
+
     result = run_tool(tool_name, params)
     return jsonify(result)
 
+@app.route("/run_batch", methods=["POST"])
+def run_batch():
+    body = request.get_json(force=True)
+    items = body.get("items") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected a list of {tool, params} items or {'items': [...]}"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Batch too large: {len(items)} items (max {BATCH_MAX_ITEMS})"}), 400
+
+    stream = request.args.get("stream") == "1" or (isinstance(body, dict) and body.get("stream"))
+    if stream:
+        # One NDJSON line per item, in completion order
+        events = dispatcher.iterate_sync(dispatcher.iter_batch(items))
+        return Response(_emit(events, lambda pair: json.dumps({"index": pair[0], "result": pair[1]}) + "\n"),
+                        mimetype="application/x-ndjson")
+
+    results = dispatcher.submit(dispatcher.run_batch(items)).result()
+    return jsonify({"count": len(results), "results": results})
+
 if __name__ == "__main__":
+    start_watcher()
     app.run(debug=True)
@@ -0,0 +1,90 @@
+"""Compare ORM and Core read paths of the db plugin on a large table.
+
+Usage:
+    python benchmarks/db_read_paths.py [--rows 1000000] [--keys 1000] [--db /tmp/bench.db]
+
+The table is filled once (reused on later runs if it already has enough rows). The query
+read cache is disabled so every `query` reaches SQLite.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--keys", type=int, default=1000, help="distinct keys; each has rows/keys records")
+    parser.add_argument("--page", type=int, default=1000, help="list_all page size")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per query/page measurement")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "mcp_bench.db"))
+    return parser.parse_args()
+
+def timed(fn, repeat):
+    """Best-of-``repeat`` wall time in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    args = parse_args()
+    # Configure before database.py / the plugin read their settings at import
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ["DB_READ_CACHE_SIZE"] = "0"
+    os.environ["DB_MAX_PAGE_SIZE"] = str(max(args.page, 1000))
+    sys.path.insert(0, ROOT)
+
+    from sqlalchemy import func, insert, select
+    from database import engine, get_session, Record
+    from plugins import db
+
+    with engine.connect() as conn:
+        existing = conn.scalar(select(func.count()).select_from(Record.__table__))
+    if existing < args.rows:
+        print(f"Filling {args.db} with {args.rows - existing} rows...")
+        batch = 100_000
+        with engine.begin() as conn:
+            for start in range(existing, args.rows, batch):
+                rows = [{"key": f"k{i % args.keys}", "value": f"value-{i}"} for i in range(start, min(start + batch, args.rows))]
+                conn.execute(insert(Record.__table__), rows)
+
+    key = "k5"
+    after_id = args.rows // 2
+
+    def orm_query():
+        with get_session() as session:
+            [{"id": r.id, "key": r.key, "value": r.value} for r in session.query(Record).filter_by(key=key).order_by(Record.id).all()]
+
+    def orm_page():
+        with get_session() as session:
+            records = session.query(Record).filter(Record.id > after_id).order_by(Record.id).limit(args.page + 1).all()
+            [{"id": r.id, "key": r.key, "value": r.value} for r in records]
+
+    def orm_stream():
+        with get_session() as session:
+            for r in session.query(Record).order_by(Record.id).yield_per(db.STREAM_BATCH):
+                {"id": r.id, "key": r.key, "value": r.value}
+
+    def core_stream():
+        for _ in db.stream({"action": "list_all"}):
+            pass
+
+    results = [
+        (f"query ({args.rows // args.keys} rows)", timed(orm_query, args.repeat),
+         timed(lambda: db.run({"action": "query", "key": key}), args.repeat)),
+        (f"list_all page ({args.page} rows)", timed(orm_page, args.repeat),
+         timed(lambda: db.run({"action": "list_all", "after_id": after_id, "limit": args.page}), args.repeat)),
+        (f"full stream ({args.rows} rows)", timed(orm_stream, 1), timed(core_stream, 1)),
+    ]
+    print(f"{'':32}{'ORM ms':>12}{'Core ms':>12}{'speedup':>10}")
+    for name, orm_ms, core_ms in results:
+        print(f"{name:32}{orm_ms:12.1f}{core_ms:12.1f}{orm_ms / core_ms:9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Compact, memory-mapped index of the OpenWeatherMap city list.
+
+Build it once from the published ``city.list.json.gz``::
+
+    python city_index.py city.list.json.gz city_index.txt
+
+The index is a sorted text file with one ``name<TAB>country<TAB>id<TAB>lat<TAB>lon<TAB>display``
+line per city, where ``name`` is normalized. Lookups binary-search the mapped file, so
+loading is instant and memory is shared with the OS page cache.
+"""
+import gzip
+import json
+import mmap
+import sys
+import unicodedata
+
+def normalize(name):
+    """Case-fold, strip accents and collapse whitespace so equivalent spellings compare equal"""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+def parse_query(query):
+    """Split an OpenWeatherMap style "city[,state][,country]" query into (name, country)"""
+    parts = [part.strip() for part in query.split(",")]
+    country = None
+    if len(parts) > 1 and len(parts[-1]) == 2 and parts[-1].isalpha():
+        country = parts[-1].upper()
+    return normalize(parts[0]), country
+
+def build_index(source, target):
+    """Convert city.list.json(.gz) into a sorted index file; returns the number of cities"""
+    opener = gzip.open if source.endswith(".gz") else open
+    with opener(source, "rt", encoding="utf-8") as f:
+        cities = json.load(f)
+    lines = []
+    for city in cities:
+        name = normalize(city["name"]).replace("\t", " ")
+        if not name:
+            continue
+        lines.append("\t".join([
+            name,
+            city.get("country", ""),
+            str(city["id"]),
+            str(city["coord"]["lat"]),
+            str(city["coord"]["lon"]),
+            city["name"].replace("\t", " ")
+        ]).encode("utf-8"))
+    lines.sort()
+    with open(target, "wb") as f:
+        f.write(b"\n".join(lines) + b"\n")
+    return len(lines)
+
+class CityIndex:
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _first_at_or_after(self, key):
+        """Offset of the first line that sorts at or after ``key``"""
+        data = self._map
+        lo, hi = 0, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind(b"\n", 0, mid) + 1
+            end = data.find(b"\n", start)
+            if data[start:end] < key:
+                lo = end + 1
+            else:
+                hi = start
+        return lo
+
+    def _scan(self, prefix, limit=None):
+        data = self._map
+        offset = self._first_at_or_after(prefix)
+        entries = []
+        while offset < len(data) and (limit is None or len(entries) < limit):
+            end = data.find(b"\n", offset)
+            line = data[offset:end]
+            if not line.startswith(prefix):
+                break
+            name, country, city_id, lat, lon, display = line.decode("utf-8").split("\t")
+            entries.append({
+                "id": int(city_id),
+                "name": display,
+                "country": country,
+                "lat": float(lat),
+                "lon": float(lon)
+            })
+            offset = end + 1
+        return entries
+
+    def lookup(self, query):
+        """All cities whose normalized name matches the query exactly (and its country, if given)"""
+        name, country = parse_query(query)
+        matches = self._scan((name + "\t").encode("utf-8"))
+        if country:
+            matches = [entry for entry in matches if entry["country"] == country]
+        return matches
+
+    def resolve(self, query):
+        """The single city a query refers to, or None when it is unknown or ambiguous"""
+        matches = self.lookup(query)
+        return matches[0] if len(matches) == 1 else None
+
+    def search(self, prefix, limit=10):
+        """Cities whose normalized name starts with ``prefix``, for suggestions"""
+        name, country = parse_query(prefix)
+        matches = self._scan(name.encode("utf-8"), limit=None if country else limit)
+        if country:
+            matches = [entry for entry in matches if entry["country"] == country][:limit]
+        return matches
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python city_index.py city.list.json[.gz] city_index.txt")
+    print(f"Indexed {build_index(sys.argv[1], sys.argv[2])} cities into {sys.argv[2]}")
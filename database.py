@@ -1,8 +1,48 @@
-from sqlalchemy import create_engine, Column, Integer, String
+import logging
+import os
+
+from sqlalchemy import create_engine, event, inspect, text, Column, Index, Integer, String
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///mcp.db")
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the single writer,
+# and busy_timeout makes writers from the Flask app and the MCP server wait instead of failing.
+PRAGMAS = {
+    "journal_mode": os.getenv("DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("DB_CACHE_SIZE", "-65536")),  # negative = KiB
+    "foreign_keys": "ON"
+}
+
+# One record per key, enabling upsert and compare-and-set in the db plugin
+UNIQUE_KEYS = os.getenv("DB_UNIQUE_KEYS", "0") == "1"
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "8"))
+
 # Setup
-engine = create_engine("sqlite:///mcp.db", echo=False)
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30"))
+)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
 Session = sessionmaker(bind=engine)
 Base = declarative_base()
 
@@ -10,13 +50,57 @@ Base = declarative_base()
 class Record(Base):
     __tablename__ = 'records'
     id = Column(Integer, primary_key=True)
+    # Indexed below. SQLite indexes carry the rowid, so the index also serves (key, id) lookups and ordering
     key = Column(String)
     value = Column(String)
+    # Bumped on every upsert/cas so clients can detect concurrent changes
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
 # Create table if not exists
 Base.metadata.create_all(engine)
 
+# create_all skips tables that already exist; bring older databases up to date
+if "version" not in {column["name"] for column in inspect(engine).get_columns("records")}:
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE records ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+# One index serves key lookups: ux_records_key with DB_UNIQUE_KEYS=1, otherwise ix_records_key.
+# A table that already holds duplicate keys cannot take the unique index, so it falls back to the plain one.
+if UNIQUE_KEYS:
+    try:
+        Index("ux_records_key", Record.key, unique=True).create(engine, checkfirst=True)
+    except IntegrityError as e:
+        logger.error("DB_UNIQUE_KEYS disabled: records has duplicate keys (%s)", e.orig)
+        UNIQUE_KEYS = False
+_indexes = {index["name"] for index in inspect(engine).get_indexes("records")}
+if "ux_records_key" in _indexes:
+    if "ix_records_key" in _indexes:
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_records_key"))
+else:
+    Index("ix_records_key", Record.key).create(engine, checkfirst=True)
+
+# Full-text index over record values for the db plugin's search action. It is an external-content
+# FTS5 table (values are not stored twice) kept in sync by triggers; a new index is filled once with 'rebuild'.
+if engine.dialect.name == "sqlite":
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'records_fts'")).first() is None:
+            conn.execute(text("CREATE VIRTUAL TABLE records_fts USING fts5(value, content='records', content_rowid='id')"))
+            conn.execute(text("INSERT INTO records_fts(records_fts) VALUES ('rebuild')"))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS records_fts_insert AFTER INSERT ON records BEGIN "
+            "INSERT INTO records_fts(rowid, value) VALUES (new.id, new.value); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS records_fts_delete AFTER DELETE ON records BEGIN "
+            "INSERT INTO records_fts(records_fts, rowid, value) VALUES ('delete', old.id, old.value); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS records_fts_update AFTER UPDATE OF value ON records BEGIN "
+            "INSERT INTO records_fts(records_fts, rowid, value) VALUES ('delete', old.id, old.value); "
+            "INSERT INTO records_fts(rowid, value) VALUES (new.id, new.value); END"
+        ))
+
 # Exported function
 def get_session():
     return Session()
-
@@ -0,0 +1,349 @@
+import asyncio
+import inspect
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from plugin_registry import get_plugin, get_registry, load_plugin_module
+from result_cache import TTLCache, make_key
+
+# Default executor for blocking plugins ("thread" or "process"); a plugin can
+# override it with a module-level EXECUTOR attribute
+DEFAULT_EXECUTOR = os.getenv("PLUGIN_EXECUTOR", "thread")
+THREAD_WORKERS = int(os.getenv("PLUGIN_THREAD_WORKERS", "32"))
+PROCESS_WORKERS = int(os.getenv("PLUGIN_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+# Items buffered between a streaming tool and a slow synchronous consumer
+STREAM_BUFFER = int(os.getenv("PLUGIN_STREAM_BUFFER", "64"))
+
+_executors = {}
+_executors_lock = threading.Lock()
+# Plugin modules the process pool was created for; reloading a plugin gets fresh workers
+_process_modules = None
+# Worker-side cache: tool name -> (mtime, module)
+_worker_modules = {}
+# (event loop, tool name, limit) -> asyncio.Semaphore enforcing a plugin's MAX_CONCURRENCY
+_semaphores = {}
+# Event loop used by synchronous callers such as the Flask app
+_loop = None
+# (event loop, plugin module, params hash) -> task of the in-flight leader call
+_inflight = {}
+_counters = {"executed": 0, "coalesced": 0}
+# Tool name -> (plugin module, cache settings, TTLCache) for plugins declaring CACHE
+_caches = {}
+_cache_counters = {}
+_refreshes = set()
+
+def _get_executor(kind):
+    if kind == "process":
+        return _get_process_executor()
+    if kind not in _executors:
+        with _executors_lock:
+            if kind not in _executors:
+                _executors[kind] = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="plugin")
+    return _executors[kind]
+
+def _get_process_executor():
+    global _process_modules
+    # A failed reload swaps the registry but keeps the old module, so compare modules, not registries
+    modules = tuple((name, entry["module"]) for name, entry in get_registry().items())
+    with _executors_lock:
+        current = _executors.get("process")
+        if current is None or _process_modules != modules:
+            # spawn, not fork: workers must not inherit open SQLite connections or a stale registry
+            _executors["process"] = ProcessPoolExecutor(
+                max_workers=PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            _process_modules = modules
+            if current is not None:
+                current.shutdown(wait=False)
+        return _executors["process"]
+
+def _run_in_process(tool_name, mtime, params):
+    """Worker entry point: import the plugin from its file, re-importing when its mtime changes"""
+    cached = _worker_modules.get(tool_name)
+    if cached is None or cached[0] != mtime:
+        try:
+            cached = (mtime, load_plugin_module(tool_name))
+        except Exception:
+            # Like the registry, keep serving the previous version when a reload fails
+            if cached is None:
+                raise
+            cached = (mtime, cached[1])
+        _worker_modules[tool_name] = cached
+    return cached[1].run(params)
+
+def _get_semaphore(tool_name, limit):
+    key = (asyncio.get_running_loop(), tool_name, limit)
+    if key not in _semaphores:
+        _semaphores[key] = asyncio.Semaphore(limit)
+    return _semaphores[key]
+
+async def _invoke(tool_name, module, params):
+    if inspect.iscoroutinefunction(getattr(module, "arun", None)):
+        return await module.arun(params)
+    if inspect.iscoroutinefunction(module.run):
+        return await module.run(params)
+    loop = asyncio.get_running_loop()
+    if getattr(module, "EXECUTOR", DEFAULT_EXECUTOR) == "process":
+        plugin = get_plugin(tool_name)
+        mtime = plugin["mtime"] if plugin is not None else None
+        return await loop.run_in_executor(_get_executor("process"), _run_in_process, tool_name, mtime, params)
+    return await loop.run_in_executor(_get_executor("thread"), module.run, params)
+
+async def _run_limited(tool_name, module, params):
+    _counters["executed"] += 1
+    limit = getattr(module, "MAX_CONCURRENCY", None)
+    if not limit:
+        return await _invoke(tool_name, module, params)
+    async with _get_semaphore(tool_name, limit):
+        return await _invoke(tool_name, module, params)
+
+def _single_flight(module, params):
+    # SINGLE_FLIGHT may be a bool or a predicate over params (e.g. only read actions)
+    flag = getattr(module, "SINGLE_FLIGHT", True)
+    return flag(params) if callable(flag) else bool(flag)
+
+async def _coalesced(tool_name, module, params):
+    if not _single_flight(module, params):
+        return await _run_limited(tool_name, module, params)
+    # Keyed on the module so calls after a reload never join one running the old code
+    key = (asyncio.get_running_loop(), module, make_key(params))
+    leader = _inflight.get(key)
+    if leader is None:
+        leader = asyncio.ensure_future(_run_limited(tool_name, module, params))
+        _inflight[key] = leader
+        leader.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        _counters["coalesced"] += 1
+    # Shielded so a cancelled follower does not cancel the shared call
+    return await asyncio.shield(leader)
+
+def _get_cache(tool_name, module, config):
+    settings = (config.get("ttl", 60), config.get("maxsize", 1024))
+    current = _caches.get(tool_name)
+    if current is None or current[0] is not module or current[1] != settings:
+        # First use, or the plugin was reloaded: results of the old code must not be served
+        current = (module, settings, TTLCache(maxsize=settings[1], ttl=settings[0]))
+        _caches[tool_name] = current
+        _cache_counters[tool_name] = {"stale_hits": 0, "refreshes": 0}
+    return current[2]
+
+def _cache_key(config, params):
+    fields = config.get("key")
+    if fields is None:
+        return make_key(params)
+    return make_key([params.get(field) for field in fields])
+
+async def _refresh(tool_name, module, params, cache, key):
+    result = await _coalesced(tool_name, module, params)
+    if not (isinstance(result, dict) and "error" in result):
+        cache.set(key, result)
+
+async def _cached(tool_name, module, params, config):
+    cache = _get_cache(tool_name, module, config)
+    counters = _cache_counters[tool_name]
+    key = _cache_key(config, params)
+    entry = cache.get_with_age(key, max_stale=config.get("stale_while_revalidate", 0))
+    if entry is not None:
+        value, age = entry
+        if age > config.get("ttl", 60):
+            # Serve the stale value now and refresh it in the background
+            counters["stale_hits"] += 1
+            counters["refreshes"] += 1
+            task = asyncio.ensure_future(_refresh(tool_name, module, params, cache, key))
+            _refreshes.add(task)
+            task.add_done_callback(_refreshes.discard)
+        return value
+    result = await _coalesced(tool_name, module, params)
+    if not (isinstance(result, dict) and "error" in result):
+        cache.set(key, result)
+    return result
+
+async def run_tool(tool_name: str, params: dict):
+    """Execute a plugin tool without blocking the running event loop.
+
+    Plugins exposing ``async def arun`` (or an ``async def run``) are awaited directly;
+    blocking ones are sent to the thread pool, or to the process pool when the plugin
+    sets ``EXECUTOR = "process"``. A plugin-level ``MAX_CONCURRENCY`` caps in-flight calls.
+    Identical concurrent calls share one execution unless the plugin sets ``SINGLE_FLIGHT``
+    to False (or to a predicate returning False for the given params).
+
+    Plugins may declare ``CACHE = {"ttl": seconds, "key": [param names]}`` to have successful
+    results cached, with optional ``maxsize`` and ``stale_while_revalidate`` (seconds a stale
+    result may be served while it is refreshed in the background). Reloading the plugin
+    starts an empty cache.
+    """
+    plugin = get_plugin(tool_name)
+    if plugin is None:
+        return {"error": f"Tool '{tool_name}' not found."}
+    if plugin["module"] is None:
+        return {"error": plugin["error"]}
+    module = plugin["module"]
+    try:
+        config = getattr(module, "CACHE", None)
+        if config:
+            return await _cached(tool_name, module, params, config)
+        return await _coalesced(tool_name, module, params)
+    except Exception as e:
+        return {"error": str(e)}
+
+def stats():
+    """Dispatcher and result-cache counters for tuning"""
+    return {
+        "executed": _counters["executed"],
+        "coalesced": _counters["coalesced"],
+        "in_flight": len(_inflight),
+        "caches": {
+            tool_name: dict(cache.stats(), **_cache_counters[tool_name])
+            for tool_name, (_, _, cache) in _caches.items()
+        }
+    }
+
+def _next_locked(iterator, lock, done):
+    with lock:
+        return next(iterator, done)
+
+def _close_locked(iterator, lock):
+    # An iterator may offer cancel() to unblock an in-flight next() (e.g. shell kills its command);
+    # then wait for that next() so the generator is never closed while it is executing
+    cancel = getattr(iterator, "cancel", None)
+    if cancel is not None:
+        cancel()
+    with lock:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+async def _iterate_blocking(iterator):
+    loop = asyncio.get_running_loop()
+    executor = _get_executor("thread")
+    lock = threading.Lock()
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, _next_locked, iterator, lock, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        # Runs the generator's cleanup (e.g. killing a shell command) when the consumer goes away
+        loop.run_in_executor(executor, _close_locked, iterator, lock)
+
+def _open_stream(module, params):
+    if hasattr(module, "astream"):
+        return module.astream(params)
+    return _iterate_blocking(module.stream(params))
+
+async def stream_tool(tool_name: str, params: dict, export: bool = False):
+    """Yield a tool's partial results as they are produced.
+
+    Plugins may define ``stream(params)`` (a generator, run on the thread pool) or
+    ``astream(params)`` (an async generator). Items carrying a ``chunk`` key are
+    partial output; the last item is the complete result, as ``run`` would return it.
+    Plugins without either yield a single final result, and so do plugins marked
+    ``STREAM_EXPORT`` (whose stream ends with a summary) unless ``export`` is set.
+    """
+    plugin = get_plugin(tool_name)
+    module = plugin["module"] if plugin else None
+    if (module is None or not (hasattr(module, "astream") or hasattr(module, "stream"))
+            or (getattr(module, "STREAM_EXPORT", False) and not export)):
+        yield await run_tool(tool_name, params)
+        return
+    limit = getattr(module, "MAX_CONCURRENCY", None)
+    semaphore = _get_semaphore(tool_name, limit) if limit else None
+    try:
+        if semaphore:
+            await semaphore.acquire()
+        async for item in _open_stream(module, params):
+            yield item
+    except Exception as e:
+        yield {"error": str(e)}
+    finally:
+        if semaphore:
+            semaphore.release()
+
+def _run_item(item):
+    if not isinstance(item, dict) or not item.get("tool"):
+        return _invalid_item()
+    return run_tool(item["tool"], item.get("params") or {})
+
+async def _invalid_item():
+    return {"error": "Each batch item must be an object with a 'tool' name and optional 'params'"}
+
+async def run_batch(items: list):
+    """Run a list of {tool, params} items concurrently and return their results in order"""
+    return await asyncio.gather(*(_run_item(item) for item in items))
+
+async def iter_batch(items: list):
+    """Yield (index, result) pairs for a batch as each call finishes"""
+    async def indexed(index, item):
+        return index, await _run_item(item)
+    tasks = [asyncio.ensure_future(indexed(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer may stop early (client disconnect); drop the calls nobody will read
+        for task in tasks:
+            task.cancel()
+
+def _get_loop():
+    global _loop
+    if _loop is None:
+        with _executors_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="plugin-dispatcher", daemon=True).start()
+                _loop = loop
+    return _loop
+
+def submit(coro):
+    """Schedule a coroutine on the dispatcher's background loop from synchronous code"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+def run_tool_sync(tool_name: str, params: dict):
+    """Blocking variant of run_tool for threaded callers such as the Flask app"""
+    return submit(run_tool(tool_name, params)).result()
+
+def iterate_sync(async_iterable):
+    """Consume an async iterable on the background loop, yielding its items to a sync caller.
+
+    At most STREAM_BUFFER items are buffered, so a slow consumer pauses the producer.
+    Closing the generator (e.g. on client disconnect) cancels the producer and closes
+    the async iterable.
+    """
+    # Both ends of the buffer live on the loop, so no plugin worker thread waits on it
+    items = asyncio.Queue(maxsize=STREAM_BUFFER)
+    done = object()
+
+    async def pump():
+        try:
+            try:
+                async for item in async_iterable:
+                    await items.put(item)
+            finally:
+                aclose = getattr(async_iterable, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        except Exception as e:
+            await items.put(e)
+            return
+        await items.put(done)
+
+    future = submit(pump())
+    try:
+        while True:
+            item = submit(items.get()).result()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+def shutdown():
+    """Stop the worker pools (used on server exit)"""
+    for executor in list(_executors.values()):
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
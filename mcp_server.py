@@ -1,74 +1,47 @@
 import asyncio
 import json
-import os
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
-import importlib
+from plugin_registry import get_registry, start_watcher
+import dispatcher
 
 # Initialize MCP server
 app = Server("hackathon-mcp-server")
 
-PLUGINS_DIR = "plugins"
-
-def get_available_tools():
-    """Get list of available plugin tools"""
-    return [f.replace(".py", "") for f in os.listdir(PLUGINS_DIR) 
-            if f.endswith(".py") and f != "__init__.py" and not f.startswith("__")]
-
 async def run_plugin_tool(tool_name: str, arguments: dict):
-    """Execute a plugin tool with given arguments"""
-    try:
-        module = importlib.import_module(f"{PLUGINS_DIR}.{tool_name}")
-        result = module.run(arguments)
-        return result
-    except ModuleNotFoundError:
-        return {"error": f"Tool '{tool_name}' not found."}
-    except Exception as e:
-        return {"error": str(e)}
+    """Execute a plugin tool with given arguments off the event loop"""
+    return await dispatcher.run_tool(tool_name, arguments)
 
 @app.list_tools()
 async def list_tools() -> list[Tool]:
-    """List all available tools from plugins directory"""
-    tools = []
-    available_tools = get_available_tools()
-    
-    for tool_name in available_tools:
-        try:
-            # Try to get tool description from plugin
-            module = importlib.import_module(f"{PLUGINS_DIR}.{tool_name}")
-            description = getattr(module, 'DESCRIPTION', f"Execute {tool_name} tool")
-            schema = getattr(module, 'SCHEMA', {
-                "type": "object",
-                "properties": {
-                    "params": {"type": "object", "description": "Tool parameters"}
-                }
-            })
-            
-            tools.append(Tool(
-                name=tool_name,
-                description=description,
-                inputSchema=schema
-            ))
-        except Exception as e:
-            # Fallback tool definition
-            tools.append(Tool(
-                name=tool_name,
-                description=f"Execute {tool_name} tool",
-                inputSchema={
-                    "type": "object",
-                    "properties": {
-                        "params": {"type": "object", "description": "Tool parameters"}
-                    }
-                }
-            ))
-    
-    return tools
+    """List all available tools from the plugin registry"""
+    return [Tool(name=tool_name, description=entry["description"], inputSchema=entry["schema"])
+            for tool_name, entry in get_registry().items()]
+
+async def stream_plugin_tool(tool_name: str, arguments: dict, progress_token):
+    """Execute a tool, reporting each partial chunk to the client as it arrives"""
+    session = app.request_context.session
+    result = None
+    chunks = 0
+    async for item in dispatcher.stream_tool(tool_name, arguments):
+        if "chunk" not in item:
+            result = item
+            continue
+        chunks += 1
+        await session.send_progress_notification(progress_token, chunks)
+        await session.send_log_message("info", item, logger=tool_name)
+    return result
 
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     """Execute a tool and return results"""
-    result = await run_plugin_tool(name, arguments)
+    meta = app.request_context.meta
+    progress_token = meta.progressToken if meta else None
+    if progress_token is not None:
+        result = await stream_plugin_tool(name, arguments, progress_token)
+    else:
+        result = await run_plugin_tool(name, arguments)
     
     return [TextContent(
         type="text",
@@ -77,8 +50,12 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent]:
 
 async def main():
     """Run the MCP server"""
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(read_stream, write_stream, app.create_initialization_options())
+    start_watcher()
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await app.run(read_stream, write_stream, app.create_initialization_options())
+    finally:
+        dispatcher.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,155 @@
+import importlib
+import importlib.util
+import logging
+import os
+import sys
+import threading
+
+PLUGINS_DIR = "plugins"
+
+DEFAULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "params": {"type": "object", "description": "Tool parameters"}
+    }
+}
+
+logger = logging.getLogger(__name__)
+
+# Tool name -> {"module", "description", "schema", "mtime"}; built once, served from memory.
+# The dict is never mutated after publication: reloads build a new one and swap the reference,
+# so callers that already fetched an entry keep running the old module version.
+_registry = None
+_lock = threading.Lock()
+_watcher = None
+
+def _discover():
+    """Scan the plugins directory for tool modules and their modification times"""
+    tools = {}
+    for f in os.listdir(PLUGINS_DIR):
+        if f.endswith(".py") and not f.startswith("__"):
+            tools[f[:-3]] = os.path.getmtime(os.path.join(PLUGINS_DIR, f))
+    return dict(sorted(tools.items()))
+
+def _validate(module):
+    if not callable(getattr(module, "run", None)):
+        raise ValueError("plugin does not define a callable 'run'")
+    if not isinstance(getattr(module, "SCHEMA", DEFAULT_SCHEMA), dict):
+        raise ValueError("plugin 'SCHEMA' must be a dict")
+
+def _import_fresh(tool_name):
+    """Execute the plugin source into a new module object, leaving the old one untouched"""
+    module_name = f"{PLUGINS_DIR}.{tool_name}"
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(PLUGINS_DIR, f"{tool_name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_plugin_module(tool_name):
+    """Import a plugin from its file into a new module object and validate it; raises on failure"""
+    module = _import_fresh(tool_name)
+    _validate(module)
+    return module
+
+def _load_entry(tool_name, mtime, fresh=False):
+    if fresh:
+        module = load_plugin_module(tool_name)
+    else:
+        module = importlib.import_module(f"{PLUGINS_DIR}.{tool_name}")
+        _validate(module)
+    if fresh:
+        sys.modules[module.__name__] = module
+    return {
+        "module": module,
+        "description": getattr(module, "DESCRIPTION", f"Execute {tool_name} tool"),
+        "schema": getattr(module, "SCHEMA", DEFAULT_SCHEMA),
+        "mtime": mtime
+    }
+
+def _error_entry(tool_name, mtime, error):
+    # Keep the tool listed so callers get the load error on run
+    return {
+        "module": None,
+        "description": f"Execute {tool_name} tool",
+        "schema": DEFAULT_SCHEMA,
+        "mtime": mtime,
+        "error": str(error)
+    }
+
+def _build():
+    registry = {}
+    for tool_name, mtime in _discover().items():
+        try:
+            registry[tool_name] = _load_entry(tool_name, mtime)
+        except Exception as e:
+            registry[tool_name] = _error_entry(tool_name, mtime, e)
+    return registry
+
+def get_registry():
+    """Return the plugin registry, scanning plugins/ on first use only"""
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                _registry = _build()
+    return _registry
+
+def get_available_tools():
+    """Get list of available plugin tools"""
+    return list(get_registry())
+
+def get_plugin(tool_name):
+    """Return the registry entry for a tool, or None if it is unknown"""
+    return get_registry().get(tool_name)
+
+def reload_changed():
+    """Reload new or modified plugins and atomically publish a new registry.
+
+    A plugin that fails to import or validate keeps serving its previous version.
+    Returns the names of the tools that were (re)loaded or removed.
+    """
+    global _registry
+    with _lock:
+        current = _registry if _registry is not None else {}
+        updated = {}
+        changed = []
+        failed = []
+        for tool_name, mtime in _discover().items():
+            old = current.get(tool_name)
+            if old is not None and old["mtime"] == mtime:
+                updated[tool_name] = old
+                continue
+            try:
+                updated[tool_name] = _load_entry(tool_name, mtime, fresh=True)
+                changed.append(tool_name)
+            except Exception as e:
+                logger.warning("Failed to reload plugin '%s': %s", tool_name, e)
+                failed.append(tool_name)
+                updated[tool_name] = dict(old, mtime=mtime) if old is not None else _error_entry(tool_name, mtime, e)
+        removed = [name for name in current if name not in updated]
+        if changed or removed or failed:
+            _registry = updated
+        if changed or removed:
+            logger.info("Plugin registry updated (changed: %s, removed: %s)", changed, removed)
+        return changed + removed
+
+def _watch(interval, stop_event):
+    while not stop_event.wait(interval):
+        try:
+            reload_changed()
+        except Exception as e:
+            logger.warning("Plugin watcher error: %s", e)
+
+def start_watcher(interval=None):
+    """Poll plugins/ for changes in a daemon thread (disable with PLUGIN_HOT_RELOAD=0)"""
+    global _watcher
+    if os.getenv("PLUGIN_HOT_RELOAD", "1") == "0" or _watcher is not None:
+        return None
+    if interval is None:
+        interval = float(os.getenv("PLUGIN_RELOAD_INTERVAL", "1.0"))
+    get_registry()
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_watch, args=(interval, stop_event), name="plugin-watcher", daemon=True)
+    thread.start()
+    _watcher = stop_event
+    return stop_event
@@ -1,4 +1,14 @@
-from database import get_session, Record
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import engine, get_session, Record, POOL_SIZE, UNIQUE_KEYS
+from result_cache import TTLCache
 
 # MCP metadata
 DESCRIPTION = "Database operations for storing and retrieving key-value records"
@@ -8,7 +18,7 @@ SCHEMA = {
         "action": {
             "type": "string",
             "description": "Database action to perform",
-            "enum": ["insert", "query", "delete", "list_all"]
+            "enum": ["insert", "query", "delete", "list_all", "insert_many", "query_many", "delete_many", "upsert", "cas", "search"]
         },
         "key": {
             "type": "string",
@@ -16,16 +26,407 @@ SCHEMA = {
         },
         "value": {
             "type": "string",
-            "description": "The value for the record (required for insert)"
+            "description": "The value for the record (required for insert, upsert and cas)"
+        },
+        "expected_version": {
+            "type": "integer",
+            "description": "cas: version the record must currently have (0 = only create if the key is absent)"
         },
         "id": {
             "type": "integer",
             "description": "Record ID (required for delete)"
+        },
+        "records": {
+            "type": "array",
+            "description": "insert_many: records to insert",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "key": {"type": "string"},
+                    "value": {"type": "string"}
+                },
+                "required": ["key", "value"]
+            }
+        },
+        "keys": {
+            "type": "array",
+            "description": "query_many: keys to look up",
+            "items": {"type": "string"}
+        },
+        "ids": {
+            "type": "array",
+            "description": "delete_many: record IDs to delete",
+            "items": {"type": "integer"}
+        },
+        "query": {
+            "type": "string",
+            "description": "search: words to find in record values"
+        },
+        "prefix": {
+            "type": "boolean",
+            "description": "search: also match words that start with each search term (default false)"
+        },
+        "after_id": {
+            "type": "integer",
+            "description": "list_all: return records with an ID greater than this (use next_after_id from the previous page)"
+        },
+        "limit": {
+            "type": "integer",
+            "description": "list_all: page size (default 100); search: maximum results (default 20)"
         }
     },
     "required": ["action"]
 }
 
+# WAL lets reads run alongside the single writer, and busy_timeout queues writers; stay within the pool
+MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", str(POOL_SIZE)))
+
+def _is_read(params):
+    return params.get("action") in ("query", "list_all", "query_many", "search")
+
+PAGE_SIZE = int(os.getenv("DB_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("DB_MAX_PAGE_SIZE", "1000"))
+STREAM_BATCH = int(os.getenv("DB_STREAM_BATCH", "500"))
+BULK_MAX_ITEMS = int(os.getenv("DB_BULK_MAX_ITEMS", "100000"))
+# Stay well below SQLite's bound-parameter limit for IN (...) lists
+IN_CHUNK = 500
+# stream() ends a list_all export with a count/last_id summary rather than the records, so only
+# exports (NDJSON /run/db?stream=1) use it; other streaming callers get run()'s paged result
+STREAM_EXPORT = True
+
+# Only reads may be coalesced with identical in-flight calls; writes must each run
+SINGLE_FLIGHT = _is_read
+
+# Read-through cache of `query` results keyed on record key. Writes made here drop their keys;
+# commits from any other connection bump SQLite's data_version, which is polled at most every
+# READ_CACHE_CHECK_INTERVAL seconds. Our own commits bump it too, so writes go through
+# _write_transaction, which absorbs their bump but clears the whole cache if another commit may be in it.
+READ_CACHE_SIZE = int(os.getenv("DB_READ_CACHE_SIZE", "1024"))
+READ_CACHE_TTL = float(os.getenv("DB_READ_CACHE_TTL", "60"))
+READ_CACHE_CHECK_INTERVAL = float(os.getenv("DB_READ_CACHE_CHECK_INTERVAL", "0.5"))
+_query_cache = TTLCache(maxsize=READ_CACHE_SIZE, ttl=READ_CACHE_TTL)
+_cache_lock = threading.Lock()
+_generation = 0
+_data_version = None
+_last_check = 0.0
+_version_conn = (
+    sqlite3.connect(engine.url.database, check_same_thread=False)
+    if READ_CACHE_SIZE and engine.dialect.name == "sqlite" and engine.url.database else None
+)
+
+def _invalidate():
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        _query_cache.clear()
+
+def _written(keys):
+    """Forget ``keys`` after a commit made here"""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        for key in keys:
+            _query_cache.delete(key)
+
+def _connection_version(conn):
+    return conn.exec_driver_sql("PRAGMA data_version").scalar()
+
+@contextmanager
+def _write_transaction():
+    """engine.begin() for writes, keeping _data_version in step without absorbing other processes' commits"""
+    global _data_version
+    if _version_conn is None:
+        with engine.begin() as conn:
+            yield conn
+        return
+    with engine.connect() as conn:
+        with conn.begin():
+            yield conn
+            # The writing connection's data_version ignores its own commit, so it changes only if
+            # another connection commits after this point; anything before is caught by the check
+            before = _connection_version(conn)
+            _check_data_version(force=True)
+        with _cache_lock:
+            _data_version = _version_conn.execute("PRAGMA data_version").fetchone()[0]
+        if _connection_version(conn) != before:
+            _invalidate()
+
+def _check_data_version(force=False):
+    global _data_version, _last_check
+    if _version_conn is None or (not force and time.monotonic() - _last_check < READ_CACHE_CHECK_INTERVAL):
+        return
+    with _cache_lock:
+        _last_check = time.monotonic()
+        version = _version_conn.execute("PRAGMA data_version").fetchone()[0]
+        changed = _data_version is not None and version != _data_version
+        _data_version = version
+    if changed:
+        _invalidate()
+
+def _query_rows(session, key):
+    if READ_CACHE_SIZE:
+        _check_data_version()
+        rows = _query_cache.get(key)
+        if rows is not None:
+            return rows
+    generation = _generation
+    statement = _select_rows.where(_records.c.key == key).order_by(_records.c.id)
+    rows = [dict(row) for row in session.execute(statement).mappings()]
+    if READ_CACHE_SIZE:
+        # Skip storing if a write invalidated the cache while we were reading
+        with _cache_lock:
+            if generation == _generation:
+                _query_cache.set(key, rows)
+    return rows
+
+def stats():
+    return {"query_cache": _query_cache.stats()}
+
+def _page(params, default_limit=None, max_limit=None):
+    """Validate keyset pagination params; returns (error, after_id, limit)"""
+    try:
+        after_id = int(params.get("after_id") or 0)
+        limit = params.get("limit", default_limit)
+        limit = None if limit is None else int(limit)
+    except (TypeError, ValueError):
+        return {"tool": "db", "error": "'after_id' and 'limit' must be integers"}, None, None
+    if limit is not None and limit < 1:
+        return {"tool": "db", "error": "'limit' must be at least 1"}, None, None
+    if limit is not None and max_limit:
+        limit = min(limit, max_limit)
+    return None, after_id, limit
+
+_records = Record.__table__
+
+# Reads select plain columns, so rows become dicts without building ORM objects or filling the identity map
+_select_rows = select(_records.c.id, _records.c.key, _records.c.value, _records.c.version)
+
+def _bulk_list(params, name, item_type):
+    """Validate a bulk action's list parameter; returns (error, items)"""
+    items = params.get(name)
+    if not isinstance(items, list) or not items:
+        return {"tool": "db", "error": f"'{name}' must be a non-empty list"}, None
+    if len(items) > BULK_MAX_ITEMS:
+        return {"tool": "db", "error": f"'{name}' is limited to {BULK_MAX_ITEMS} items"}, None
+    if not all(isinstance(item, item_type) for item in items):
+        return {"tool": "db", "error": f"'{name}' items must be of type {item_type.__name__}"}, None
+    return None, items
+
+def _chunks(items):
+    for start in range(0, len(items), IN_CHUNK):
+        yield items[start:start + IN_CHUNK]
+
+def _insert_many(params):
+    error, records = _bulk_list(params, "records", dict)
+    if error:
+        return error
+    rows = [{"key": r.get("key"), "value": r.get("value")} for r in records]
+    if not all(row["key"] and row["value"] for row in rows):
+        return {"tool": "db", "error": "Every record needs both 'key' and 'value'"}
+    
+    # One transaction, one executemany; RETURNING hands back the new IDs in input order
+    with _write_transaction() as conn:
+        ids = conn.scalars(insert(_records).returning(_records.c.id, sort_by_parameter_order=True), rows).all()
+    _written({row["key"] for row in rows})
+    return {
+        "tool": "db",
+        "action": "insert_many",
+        "status": "success",
+        "count": len(ids),
+        "ids": ids
+    }
+
+def _query_many(params):
+    error, keys = _bulk_list(params, "keys", str)
+    if error:
+        return error
+    
+    results = {key: [] for key in keys}
+    with engine.connect() as conn:
+        for chunk in _chunks(list(results)):
+            rows = conn.execute(_select_rows.where(_records.c.key.in_(chunk)).order_by(_records.c.id))
+            for row in rows.mappings():
+                results[row["key"]].append(dict(row))
+    return {
+        "tool": "db",
+        "action": "query_many",
+        "count": sum(len(rows) for rows in results.values()),
+        "results": results
+    }
+
+def _delete_many(params):
+    error, ids = _bulk_list(params, "ids", int)
+    if error:
+        return error
+    
+    deleted = []
+    with _write_transaction() as conn:
+        for chunk in _chunks(ids):
+            deleted.extend(conn.execute(delete(_records).where(_records.c.id.in_(chunk)).returning(_records.c.id, _records.c.key)))
+    _written({row.key for row in deleted})
+    deleted = [row.id for row in deleted]
+    missing = set(ids) - set(deleted)
+    return {
+        "tool": "db",
+        "action": "delete_many",
+        "status": "success",
+        "deleted_count": len(deleted),
+        "deleted_ids": sorted(deleted),
+        "not_found": sorted(missing)
+    }
+
+def _key_value(params, action):
+    key = params.get("key")
+    value = params.get("value")
+    if not key or not value:
+        return {"tool": "db", "error": f"Both 'key' and 'value' are required for {action}"}, None, None
+    if not UNIQUE_KEYS:
+        return {"tool": "db", "error": f"'{action}' needs one record per key; set DB_UNIQUE_KEYS=1 and remove duplicate keys"}, None, None
+    return None, key, value
+
+def _upsert(params):
+    error, key, value = _key_value(params, "upsert")
+    if error:
+        return error
+    
+    # A single INSERT ... ON CONFLICT DO UPDATE replaces query + delete + insert
+    statement = sqlite_insert(_records).values(key=key, value=value, version=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[_records.c.key],
+        set_={"value": statement.excluded.value, "version": _records.c.version + 1}
+    ).returning(_records.c.id, _records.c.version)
+    with _write_transaction() as conn:
+        row = conn.execute(statement).one()
+    _written([key])
+    return {
+        "tool": "db",
+        "action": "upsert",
+        "status": "success",
+        "id": row.id,
+        "key": key,
+        "value": value,
+        "version": row.version
+    }
+
+def _cas(params):
+    error, key, value = _key_value(params, "cas")
+    if error:
+        return error
+    expected = params.get("expected_version")
+    if not isinstance(expected, int) or isinstance(expected, bool):
+        return {"tool": "db", "error": "'expected_version' (integer) is required for cas"}
+    
+    if expected == 0:
+        statement = sqlite_insert(_records).values(key=key, value=value, version=1).on_conflict_do_nothing()
+    else:
+        statement = _records.update().where(_records.c.key == key, _records.c.version == expected)
+        statement = statement.values(value=value, version=_records.c.version + 1)
+    with _write_transaction() as conn:
+        row = conn.execute(statement.returning(_records.c.id, _records.c.version)).first()
+        if row is None:
+            current = conn.scalar(select(_records.c.version).where(_records.c.key == key))
+    if row is None:
+        return {
+            "tool": "db",
+            "action": "cas",
+            "status": "conflict",
+            "key": key,
+            "expected_version": expected,
+            "current_version": current or 0
+        }
+    _written([key])
+    return {
+        "tool": "db",
+        "action": "cas",
+        "status": "success",
+        "id": row.id,
+        "key": key,
+        "value": value,
+        "version": row.version
+    }
+
+SEARCH_LIMIT = int(os.getenv("DB_SEARCH_LIMIT", "20"))
+
+_search_rows = text(
+    "SELECT records.id, records.key, records.value, records.version, records_fts.rank AS score "
+    "FROM records_fts JOIN records ON records.id = records_fts.rowid "
+    "WHERE records_fts MATCH :match ORDER BY records_fts.rank LIMIT :limit"
+)
+
+def _match_expression(query, prefix):
+    """Quote each term so punctuation cannot break FTS5 syntax; terms are ANDed"""
+    terms = ['"' + term.replace('"', '""') + '"' + ("*" if prefix else "") for term in query.split()]
+    return " ".join(terms)
+
+def _search(params):
+    query = params.get("query")
+    if not isinstance(query, str) or not query.strip():
+        return {"tool": "db", "error": "'query' parameter required for search"}
+    error, _, limit = _page(params, SEARCH_LIMIT, MAX_PAGE_SIZE)
+    if error:
+        return error
+    
+    # bm25 rank: lower is a better match
+    with engine.connect() as conn:
+        rows = conn.execute(_search_rows, {"match": _match_expression(query, bool(params.get("prefix"))), "limit": limit})
+        results = [dict(row) for row in rows.mappings()]
+    return {
+        "tool": "db",
+        "action": "search",
+        "query": query,
+        "count": len(results),
+        "results": results
+    }
+
+# Actions that run directly on a Core connection rather than an ORM session
+CORE_ACTIONS = {
+    "insert_many": _insert_many,
+    "query_many": _query_many,
+    "delete_many": _delete_many,
+    "upsert": _upsert,
+    "cas": _cas,
+    "search": _search
+}
+
+def stream(params):
+    """Yield list_all records in chunks of up to STREAM_BATCH rows without loading the table; other actions yield run()"""
+    if params.get("action") != "list_all":
+        yield run(params)
+        return
+    error, after_id, limit = _page(params)
+    if error:
+        yield error
+        return
+
+    session = get_session()
+    try:
+        statement = _select_rows.where(_records.c.id > after_id).order_by(_records.c.id)
+        if limit is not None:
+            statement = statement.limit(limit)
+        count, last_id = 0, None
+        rows = session.execute(statement, execution_options={"yield_per": STREAM_BATCH})
+        # One chunk per yield_per partition keeps the per-item cost of streaming off the per-row path
+        for partition in rows.mappings().partitions():
+            chunk = [dict(row) for row in partition]
+            count, last_id = count + len(chunk), chunk[-1]["id"]
+            yield {
+                "tool": "db",
+                "chunk": chunk
+            }
+        yield {
+            "tool": "db",
+            "action": "list_all",
+            "count": count,
+            "last_id": last_id
+        }
+    except Exception as e:
+        yield {
+            "tool": "db",
+            "error": f"Database error: {str(e)}"
+        }
+    finally:
+        session.close()
+
 def run(params):
     action = params.get("action", "")
     if not action:
@@ -34,6 +435,15 @@ def run(params):
             "error": "Missing 'action' parameter"
         }
 
+    if action in CORE_ACTIONS:
+        try:
+            return CORE_ACTIONS[action](params)
+        except Exception as e:
+            return {
+                "tool": "db",
+                "error": f"Database error: {str(e)}"
+            }
+
     try:
         session = get_session()
         
@@ -47,14 +457,14 @@ def run(params):
                     "error": "Both 'key' and 'value' are required for insert"
                 }
             
-            record = Record(key=key, value=value)
-            session.add(record)
-            session.commit()
+            with _write_transaction() as conn:
+                record_id = conn.scalar(insert(_records).values(key=key, value=value).returning(_records.c.id))
+            _written([key])
             return {
                 "tool": "db",
                 "action": "insert",
                 "status": "success",
-                "id": record.id,
+                "id": record_id,
                 "key": key,
                 "value": value
             }
@@ -67,22 +477,31 @@ def run(params):
                     "error": "'key' parameter required for query"
                 }
             
-            result = session.query(Record).filter_by(key=key).all()
+            result = _query_rows(session, key)
             return {
                 "tool": "db",
                 "action": "query",
                 "key": key,
                 "count": len(result),
-                "results": [{"id": r.id, "key": r.key, "value": r.value} for r in result]
+                "results": result
             }
         
         elif action == "list_all":
-            result = session.query(Record).all()
+            error, after_id, limit = _page(params, PAGE_SIZE, MAX_PAGE_SIZE)
+            if error:
+                return error
+            
+            # Keyset pagination: seek past after_id on the primary key, fetch one extra row to detect more pages
+            statement = _select_rows.where(_records.c.id > after_id).order_by(_records.c.id).limit(limit + 1)
+            result = [dict(row) for row in session.execute(statement).mappings()]
+            has_more = len(result) > limit
+            result = result[:limit]
             return {
                 "tool": "db",
                 "action": "list_all",
                 "count": len(result),
-                "results": [{"id": r.id, "key": r.key, "value": r.value} for r in result]
+                "results": result,
+                "next_after_id": result[-1]["id"] if has_more else None
             }
         
         elif action == "delete":
@@ -93,10 +512,10 @@ def run(params):
                     "error": "'id' parameter required for delete"
                 }
             
-            record = session.query(Record).filter_by(id=record_id).first()
-            if record:
-                session.delete(record)
-                session.commit()
+            with _write_transaction() as conn:
+                key = conn.scalar(delete(_records).where(_records.c.id == record_id).returning(_records.c.key))
+            if key is not None:
+                _written([key])
                 return {
                     "tool": "db",
                     "action": "delete",
@@ -113,7 +532,7 @@ def run(params):
         else:
             return {
                 "tool": "db",
-                "error": f"Invalid action '{action}'. Use 'insert', 'query', 'delete', or 'list_all'"
+                "error": f"Invalid action '{action}'. Use 'insert', 'query', 'delete', 'list_all', 'insert_many', 'query_many', 'delete_many', 'upsert', 'cas' or 'search'"
             }
             
     except Exception as e:
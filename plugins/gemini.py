@@ -1,5 +1,13 @@
 import google.generativeai as genai
+import asyncio
+import json
 import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from rate_limit import QuotaScheduler, RateLimitExceeded
+from result_cache import DiskCache, TTLCache, make_key
 
 # MCP metadata
 DESCRIPTION = "Generate text using Google Gemini AI model"
@@ -9,7 +17,8 @@ SCHEMA = {
         "prompt": {
             "type": "string",
             "description": "The text prompt to generate content for"
-        },        "model": {
+        },
+        "model": {
             "type": "string",
             "description": "Gemini model to use",
             "enum": ["gemini-1.5-pro", "gemini-1.5-flash", "gemini-pro"],
@@ -19,29 +28,121 @@ SCHEMA = {
             "type": "integer",
             "description": "Maximum tokens to generate",
             "default": 1000
+        },
+        "temperature": {
+            "type": "number",
+            "description": "Sampling temperature",
+            "default": 0.7
+        },
+        "hedge": {
+            "type": "string",
+            "description": "Fallback strategy: 'off' tries models one after another, 'hedge' also starts the next model when the current one has not answered within hedge_delay_ms, 'race' queries all models at once",
+            "enum": ["off", "hedge", "race"],
+            "default": "off"
+        },
+        "hedge_delay_ms": {
+            "type": "integer",
+            "description": "Delay before hedging to the next model (default: p95 of recent latency)"
+        },
+        "cache": {
+            "type": "string",
+            "description": "Response cache mode: 'use' serves identical earlier requests from cache, 'bypass' skips it, 'refresh' calls the API and overwrites the cached entry",
+            "enum": ["use", "bypass", "refresh"],
+            "default": "use"
         }
     },
     "required": ["prompt"]
 }
 
-def run(params):
+# Pure network I/O; the cap keeps bursts within the free-tier request quota
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "15"))
+
+# Configured client state, reused across calls so transports keep their connections warm.
+# (api key, model name, generation config) -> GenerativeModel, least recently used first
+MODEL_CACHE_SIZE = int(os.getenv("GEMINI_MODEL_CACHE_SIZE", "32"))
+_models = OrderedDict()
+_models_lock = threading.Lock()
+_configured_key = None
+
+# Identical requests are answered from memory first, then from an optional sqlite file
+# (GEMINI_CACHE_DB) that survives restarts
+CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+_response_cache = TTLCache(
+    maxsize=int(os.getenv("GEMINI_CACHE_SIZE", "1024")),
+    ttl=CACHE_TTL,
+    max_bytes=int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+)
+_disk_cache = DiskCache(
+    os.getenv("GEMINI_CACHE_DB"),
+    ttl=CACHE_TTL,
+    table="gemini_responses",
+    max_bytes=int(os.getenv("GEMINI_CACHE_DB_MAX_BYTES", str(64 * 1024 * 1024)))
+) if os.getenv("GEMINI_CACHE_DB") else None
+
+# Recent successful call latencies per model, used to pick the hedge delay
+HEDGE_DEFAULT_DELAY_MS = int(os.getenv("GEMINI_HEDGE_DELAY_MS", "2000"))
+_latencies = {}
+_latencies_lock = threading.Lock()
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("GEMINI_HEDGE_WORKERS", "16")), thread_name_prefix="gemini-hedge")
+
+# Client-side quota per model (requests/minute, tokens/minute, requests/day), matching the
+# free tier; override with GEMINI_RATE_LIMITS='{"gemini-pro": {"rpm": 60, "tpm": 32000, "rpd": 1500}}'
+RATE_LIMITS = {
+    "gemini-1.5-flash": {"rpm": 15, "tpm": 1000000, "rpd": 1500},
+    "gemini-1.5-pro": {"rpm": 15, "tpm": 32000, "rpd": 1500},
+    "gemini-pro": {"rpm": 60, "tpm": 32000, "rpd": 1500}
+}
+RATE_LIMITS.update(json.loads(os.getenv("GEMINI_RATE_LIMITS", "{}")))
+# Longest a call queues for quota before it is reported as rate limited
+QUOTA_MAX_WAIT = float(os.getenv("GEMINI_QUOTA_MAX_WAIT", "10"))
+_quota = QuotaScheduler(RATE_LIMITS, path=os.getenv("GEMINI_QUOTA_DB", "gemini_quota.db"))
+
+def _configure(api_key):
+    """Configure the client once per API key; a new key invalidates every cached model"""
+    global _configured_key
+    if api_key == _configured_key:
+        return
+    with _models_lock:
+        if api_key != _configured_key:
+            genai.configure(api_key=api_key)
+            _models.clear()
+            _configured_key = api_key
+
+def _get_model(model_name, params):
+    generation_config = _generation_config(params)
+    with _models_lock:
+        key = (_configured_key, model_name, tuple(sorted(generation_config.items())))
+        model = _models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(model_name, generation_config=generation_config)
+            _models[key] = model
+            if len(_models) > MODEL_CACHE_SIZE:
+                _models.popitem(last=False)
+        else:
+            _models.move_to_end(key)
+        return model
+
+def _prepare(params):
+    """Return (error, prompt, model_name, models_to_try)"""
     # Get API key from environment variable
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         return {
             "tool": "gemini",
             "error": "GEMINI_API_KEY environment variable not set. Please set it with your API key."
-        }
+        }, None, None, None
     
-    # Configure API key
-    genai.configure(api_key=api_key)
+    # Configure API key (no-op unless it changed)
+    _configure(api_key)
     
     prompt = params.get("prompt", "")
     if not prompt:
         return {
             "tool": "gemini",
             "error": "Missing 'prompt' parameter"
-        }    # Get model name with fallback strategy
+        }, None, None, None
+
+    # Get model name with fallback strategy
     model_name = params.get("model", "gemini-1.5-flash")  # Default to flash for lower quota usage
     fallback_models = ["gemini-1.5-flash", "gemini-pro", "gemini-1.5-pro"]
     
@@ -50,60 +151,409 @@ def run(params):
         fallback_models.remove(model_name)
     
     # Try the requested model first, then fallbacks
-    models_to_try = [model_name] + fallback_models
+    return None, prompt, model_name, [model_name] + fallback_models
+
+def _generation_config(params):
+    return {
+        "max_output_tokens": min(params.get("max_tokens", 1000), 500),  # Reduce token usage
+        "temperature": params.get("temperature", 0.7)
+    }
+
+def _success(response, text, prompt, model_name, current_model):
+    return {
+        "tool": "gemini",
+        "model": current_model,
+        "prompt": prompt,
+        "result": text,
+        "fallback_used": current_model != model_name,
+        "usage": {
+            "prompt_tokens": response.usage_metadata.prompt_token_count if hasattr(response, 'usage_metadata') else None,
+            "completion_tokens": response.usage_metadata.candidates_token_count if hasattr(response, 'usage_metadata') else None
+        }
+    }
+
+def _is_quota_error(e):
+    error_str = str(e)
+    return "429" in error_str or "quota" in error_str.lower() or "rate limit" in error_str.lower()
+
+def _estimate_tokens(prompt, params):
+    # Roughly 4 characters per token, plus the full output allowance
+    return len(prompt) // 4 + _generation_config(params)["max_output_tokens"]
+
+def _reserve_wait(current_model, tokens, deadline):
+    """Return seconds to sleep before retrying the reservation; raise if the wait exceeds the deadline"""
+    wait = _quota.reserve(current_model, tokens)
+    if wait and time.monotonic() + wait > deadline:
+        raise RateLimitExceeded(f"Local rate limit reached for {current_model}, next slot in {wait:.1f}s")
+    return wait
+
+def _acquire(current_model, tokens):
+    """Block until the model's quota admits this call (up to QUOTA_MAX_WAIT)"""
+    deadline = time.monotonic() + QUOTA_MAX_WAIT
+    while True:
+        wait = _reserve_wait(current_model, tokens, deadline)
+        if not wait:
+            return
+        time.sleep(wait)
+
+async def _aacquire(current_model, tokens):
+    # The scheduler commits to sqlite (and may wait on the other server's lock), so keep it off the loop
+    deadline = time.monotonic() + QUOTA_MAX_WAIT
+    while True:
+        wait = await asyncio.to_thread(_reserve_wait, current_model, tokens, deadline)
+        if not wait:
+            return
+        await asyncio.sleep(wait)
+
+def _schedule(prompt, params, models_to_try):
+    """Return (tokens, models) with models that have quota headroom first and exhausted ones dropped"""
+    tokens = _estimate_tokens(prompt, params)
+    return tokens, _quota.order(models_to_try, tokens)
+
+async def _aschedule(prompt, params, models_to_try):
+    return await asyncio.to_thread(_schedule, prompt, params, models_to_try)
+
+def _penalize(e, current_model):
+    if _is_quota_error(e) and not isinstance(e, RateLimitExceeded):
+        # The upstream disagrees with our buckets; stop sending to this model for a while
+        _quota.penalize(current_model)
+
+def _failure(e, current_model, models_to_try):
+    """Return the final error result, or None when the next fallback model should be tried"""
+    if models_to_try and current_model != models_to_try[-1]:  # Not the last model to try
+        return None
+    return _error_result(e, current_model, models_to_try)
+
+def _error_result(e, current_model, models_to_try):
+    error_str = str(e)
+    
+    # Check if it's a quota/rate limit error
+    if _is_quota_error(e):
+        # All models failed due to quota
+        return {
+            "tool": "gemini",
+            "error": "All Gemini models have exceeded quota limits. Please try again later or upgrade your plan.",
+            "quota_exceeded": True,
+            "models_tried": models_to_try,
+            "suggestion": "Consider using gemini-1.5-flash model which has higher quotas, or try again in a few minutes.",
+            "rate_limit_info": "Free tier limits: 15 requests/minute, 1,500 requests/day per model"
+        }
+    else:
+        # All models failed with non-quota errors
+        return {
+            "tool": "gemini",
+            "error": f"Gemini API error: {error_str}",
+            "model": current_model,
+            "models_tried": models_to_try
+        }
+
+def _chunk(current_model, text):
+    return {
+        "tool": "gemini",
+        "model": current_model,
+        "chunk": text
+    }
+
+def _interrupted(e, current_model, chunks):
+    # Chunks already reached the caller, so falling back to another model would repeat output
+    return {
+        "tool": "gemini",
+        "error": f"Gemini stream interrupted: {str(e)}",
+        "model": current_model,
+        "partial_result": "".join(chunks)
+    }
+
+def _cache_key(prompt, model_name, params):
+    # Whitespace and case-insensitive fields are normalized so trivially different requests share an entry
+    return make_key(" ".join(prompt.split()), model_name.strip().lower(), _generation_config(params))
+
+def _cache_lookup(params, prompt, model_name):
+    """Return (cache_key, cached_result); the key is None when caching is bypassed"""
+    mode = params.get("cache", "use")
+    if mode == "bypass":
+        return None, None
+    key = _cache_key(prompt, model_name, params)
+    if mode == "refresh":
+        return key, None
+    cached = _response_cache.get(key)
+    if cached is None and _disk_cache is not None:
+        cached = _disk_cache.get(key)
+        if cached is not None:
+            _response_cache.set(key, cached)
+    if cached is not None:
+        cached = dict(cached, cached=True)
+    return key, cached
+
+def _cache_store(key, result):
+    if key is None or "error" in result:
+        return
+    _response_cache.set(key, result)
+    if _disk_cache is not None:
+        _disk_cache.set(key, result)
+
+# The sqlite disk tier must not block the event loop; the memory tier alone is cheap enough to call inline
+async def _acache_lookup(params, prompt, model_name):
+    if _disk_cache is None:
+        return _cache_lookup(params, prompt, model_name)
+    return await asyncio.to_thread(_cache_lookup, params, prompt, model_name)
+
+async def _acache_store(key, result):
+    if _disk_cache is None:
+        return _cache_store(key, result)
+    await asyncio.to_thread(_cache_store, key, result)
+
+def _record_latency(model_name, seconds):
+    with _latencies_lock:
+        _latencies.setdefault(model_name, deque(maxlen=100)).append(seconds)
+
+def _hedge_delay(params, model_name):
+    """Seconds to wait before hedging: explicit parameter, else p95 of recent latency"""
+    if params.get("hedge_delay_ms") is not None:
+        return params["hedge_delay_ms"] / 1000
+    with _latencies_lock:
+        samples = sorted(_latencies.get(model_name, ()))
+    if len(samples) < 5:
+        return HEDGE_DEFAULT_DELAY_MS / 1000
+    return samples[int(0.95 * (len(samples) - 1))]
+
+def _hedged_success(response, text, prompt, model_name, current_model, mode, delay, attempted):
+    result = _success(response, text, prompt, model_name, current_model)
+    result["hedge"] = {
+        "mode": mode,
+        "delay_ms": None if mode == "race" else round(delay * 1000),
+        "winner": current_model,
+        "models_started": attempted
+    }
+    return result
+
+def _call_model(current_model, params, prompt):
+    started = time.monotonic()
+    response = _get_model(current_model, params).generate_content(prompt)
+    text = response.text
+    _record_latency(current_model, time.monotonic() - started)
+    return response, text
+
+async def _acall_model(current_model, params, prompt):
+    started = time.monotonic()
+    response = await _get_model(current_model, params).generate_content_async(prompt)
+    text = response.text
+    _record_latency(current_model, time.monotonic() - started)
+    return response, text
+
+def _generate_hedged(params, prompt, model_name, models_to_try, mode):
+    """Overlap fallback attempts and return the first successful answer"""
+    delay = _hedge_delay(params, model_name)
+    tokens, models_to_try = _schedule(prompt, params, models_to_try)
+    pending = {}
+    launched = []  # models considered so far, including ones skipped for lack of quota
+    attempted = []
+    last_error = RateLimitExceeded("No Gemini model has quota available")
+    last_model = None  # model that raised last_error
+
+    def launch():
+        # Hedges only go to models with quota available right now
+        while len(launched) < len(models_to_try):
+            current_model = models_to_try[len(launched)]
+            launched.append(current_model)
+            if _quota.reserve(current_model, tokens) == 0:
+                pending[_hedge_pool.submit(_call_model, current_model, params, prompt)] = current_model
+                attempted.append(current_model)
+                return
+
+    launch()
+    while mode == "race" and len(launched) < len(models_to_try):
+        launch()
+    while pending:
+        done, _ = wait(pending, timeout=delay if len(launched) < len(models_to_try) else None, return_when=FIRST_COMPLETED)
+        failed = False
+        for future in done:
+            current_model = pending.pop(future)
+            try:
+                response, text = future.result()
+            except Exception as e:
+                _penalize(e, current_model)
+                last_error, last_model = e, current_model
+                failed = True
+                continue
+            # Slower attempts cannot be interrupted mid-request; drop them and cancel any not yet started
+            for other in pending:
+                other.cancel()
+            return _hedged_success(response, text, prompt, model_name, current_model, mode, delay, attempted)
+        # Hedge after the delay, or immediately once an attempt has failed
+        if (failed or not done) and len(launched) < len(models_to_try):
+            launch()
+    return _error_result(last_error, last_model, launched)
+
+async def _agenerate_hedged(params, prompt, model_name, models_to_try, mode):
+    delay = _hedge_delay(params, model_name)
+    tokens, models_to_try = await _aschedule(prompt, params, models_to_try)
+    pending = {}
+    launched = []  # models considered so far, including ones skipped for lack of quota
+    attempted = []
+    last_error = RateLimitExceeded("No Gemini model has quota available")
+    last_model = None  # model that raised last_error
+
+    async def launch():
+        while len(launched) < len(models_to_try):
+            current_model = models_to_try[len(launched)]
+            launched.append(current_model)
+            if await asyncio.to_thread(_quota.reserve, current_model, tokens) == 0:
+                pending[asyncio.ensure_future(_acall_model(current_model, params, prompt))] = current_model
+                attempted.append(current_model)
+                return
+
+    try:
+        await launch()
+        while mode == "race" and len(launched) < len(models_to_try):
+            await launch()
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=delay if len(launched) < len(models_to_try) else None, return_when=asyncio.FIRST_COMPLETED)
+            failed = False
+            for task in done:
+                current_model = pending.pop(task)
+                try:
+                    response, text = task.result()
+                except Exception as e:
+                    await asyncio.to_thread(_penalize, e, current_model)
+                    last_error, last_model = e, current_model
+                    failed = True
+                    continue
+                return _hedged_success(response, text, prompt, model_name, current_model, mode, delay, attempted)
+            if (failed or not done) and len(launched) < len(models_to_try):
+                await launch()
+        return _error_result(last_error, last_model, launched)
+    finally:
+        # Cancel the losing requests
+        for task in pending:
+            task.cancel()
+
+def stats():
+    return {
+        "response_cache": _response_cache.stats(),
+        "quota": _quota.stats()
+    }
+
+def stream(params):
+    """Yield text chunks as Gemini produces them, then the result assembled from those chunks"""
+    error, prompt, model_name, models_to_try = _prepare(params)
+    if error:
+        yield error
+        return
+    
+    key, cached = _cache_lookup(params, prompt, model_name)
+    if cached is not None:
+        yield cached
+        return
+    
+    mode = params.get("hedge", "off")
+    if mode in ("hedge", "race"):
+        # Hedged calls race whole responses, so only the winner's final result is emitted
+        result = _generate_hedged(params, prompt, model_name, models_to_try, mode)
+        _cache_store(key, result)
+        yield result
+        return
+    
+    for item in _generate(params, prompt, model_name, models_to_try):
+        if "chunk" not in item:
+            _cache_store(key, item)
+        yield item
+
+async def astream(params):
+    error, prompt, model_name, models_to_try = _prepare(params)
+    if error:
+        yield error
+        return
+    
+    key, cached = await _acache_lookup(params, prompt, model_name)
+    if cached is not None:
+        yield cached
+        return
+    
+    mode = params.get("hedge", "off")
+    if mode in ("hedge", "race"):
+        result = await _agenerate_hedged(params, prompt, model_name, models_to_try, mode)
+        await _acache_store(key, result)
+        yield result
+        return
+    
+    async for item in _agenerate(params, prompt, model_name, models_to_try):
+        if "chunk" not in item:
+            await _acache_store(key, item)
+        yield item
+
+def _generate(params, prompt, model_name, models_to_try):
+    tokens, models_to_try = _schedule(prompt, params, models_to_try)
+    if not models_to_try:
+        yield _failure(RateLimitExceeded("Daily request budget used up for every Gemini model"), None, [])
+        return
     
     for current_model in models_to_try:
+        chunks = []
         try:
-            # Initialize model
-            model = genai.GenerativeModel(current_model)
+            # Wait for (or reroute around) the client-side quota
+            _acquire(current_model, tokens)
             
-            # Generate content with rate limiting considerations
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=min(params.get("max_tokens", 1000), 500),  # Reduce token usage
-                    temperature=0.7
-                )
-            )
+            # Reuse the cached model for this generation config
+            model = _get_model(current_model, params)
             
-            return {
-                "tool": "gemini",
-                "model": current_model,
-                "prompt": prompt,
-                "result": response.text,
-                "fallback_used": current_model != model_name,
-                "usage": {
-                    "prompt_tokens": response.usage_metadata.prompt_token_count if hasattr(response, 'usage_metadata') else None,
-                    "completion_tokens": response.usage_metadata.candidates_token_count if hasattr(response, 'usage_metadata') else None
-                }
-            }
+            # Generate content with rate limiting considerations
+            started = time.monotonic()
+            response = model.generate_content(prompt, stream=True)
+            for part in response:
+                chunks.append(part.text)
+                yield _chunk(current_model, part.text)
+            _record_latency(current_model, time.monotonic() - started)
+            yield _success(response, "".join(chunks), prompt, model_name, current_model)
+            return
         
         except Exception as e:
-            error_str = str(e)
-            
-            # Check if it's a quota/rate limit error
-            if "429" in error_str or "quota" in error_str.lower() or "rate limit" in error_str.lower():
-                if current_model != models_to_try[-1]:  # Not the last model to try
-                    continue  # Try next model
-                else:
-                    # All models failed due to quota
-                    return {
-                        "tool": "gemini",
-                        "error": "All Gemini models have exceeded quota limits. Please try again later or upgrade your plan.",
-                        "quota_exceeded": True,
-                        "models_tried": models_to_try,
-                        "suggestion": "Consider using gemini-1.5-flash model which has higher quotas, or try again in a few minutes.",
-                        "rate_limit_info": "Free tier limits: 15 requests/minute, 1,500 requests/day per model"
-                    }
-            else:
-                # Other error, try next model
-                if current_model != models_to_try[-1]:
-                    continue
-                else:
-                    # All models failed with non-quota errors
-                    return {
-                        "tool": "gemini",
-                        "error": f"Gemini API error: {error_str}",
-                        "model": current_model,
-                        "models_tried": models_to_try
-                    }
+            if chunks:
+                yield _interrupted(e, current_model, chunks)
+                return
+            _penalize(e, current_model)
+            result = _failure(e, current_model, models_to_try)
+            if result:
+                yield result
+                return
+
+async def _agenerate(params, prompt, model_name, models_to_try):
+    tokens, models_to_try = await _aschedule(prompt, params, models_to_try)
+    if not models_to_try:
+        yield _failure(RateLimitExceeded("Daily request budget used up for every Gemini model"), None, [])
+        return
+    
+    for current_model in models_to_try:
+        chunks = []
+        try:
+            await _aacquire(current_model, tokens)
+            model = _get_model(current_model, params)
+            started = time.monotonic()
+            response = await model.generate_content_async(prompt, stream=True)
+            async for part in response:
+                chunks.append(part.text)
+                yield _chunk(current_model, part.text)
+            _record_latency(current_model, time.monotonic() - started)
+            yield _success(response, "".join(chunks), prompt, model_name, current_model)
+            return
+        
+        except Exception as e:
+            if chunks:
+                yield _interrupted(e, current_model, chunks)
+                return
+            await asyncio.to_thread(_penalize, e, current_model)
+            result = _failure(e, current_model, models_to_try)
+            if result:
+                yield result
+                return
+
+def run(params):
+    result = None
+    for item in stream(params):
+        result = item
+    return result
+
+async def arun(params):
+    result = None
+    async for item in astream(params):
+        result = item
+    return result
@@ -1,5 +1,8 @@
+import os
+import signal
 import subprocess
 import platform
+import threading
 
 # MCP metadata
 DESCRIPTION = "Execute shell commands safely"
@@ -19,13 +22,17 @@ SCHEMA = {
     "required": ["command"]
 }
 
-def run(params):
+# Commands have side effects, so identical concurrent calls must each run
+SINGLE_FLIGHT = False
+
+def _check(params):
+    """Return (error, command, timeout) after validating the request"""
     command = params.get("command", "")
     if not command:
         return {
             "tool": "shell",
             "error": "Missing 'command' parameter"
-        }
+        }, None, None
     
     timeout = params.get("timeout", 30)
     
@@ -35,7 +42,14 @@ def run(params):
         return {
             "tool": "shell",
             "error": "Command blocked for security reasons"
-        }
+        }, None, None
+    
+    return None, command, timeout
+
+def run(params):
+    error, command, timeout = _check(params)
+    if error:
+        return error
     
     try:
         result = subprocess.run(
@@ -66,3 +80,111 @@ def run(params):
             "tool": "shell",
             "error": f"Shell execution error: {str(e)}"
         }
+
+def _kill(process):
+    """Kill the command and everything it started, not just the shell"""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
+
+class _Stream:
+    """Iterator over _stream() whose cancel() kills the command, releasing a next() blocked on its output"""
+    def __init__(self, params):
+        self.process = None
+        self._events = _stream(params, self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def cancel(self):
+        if self.process is not None:
+            _kill(self.process)
+
+    def close(self):
+        self._events.close()
+
+def stream(params):
+    """Yield stdout lines as they are printed, then the same result dict as run()"""
+    return _Stream(params)
+
+def _stream(params, handle):
+    error, command, timeout = _check(params)
+    if error:
+        yield error
+        return
+    
+    try:
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            start_new_session=True
+        )
+    except Exception as e:
+        yield {
+            "tool": "shell",
+            "error": f"Shell execution error: {str(e)}"
+        }
+        return
+    handle.process = process
+    
+    # Drain stderr in the background so a chatty command cannot block on a full pipe
+    stderr_lines = []
+    stderr_reader = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+    stderr_reader.start()
+    timed_out = threading.Event()
+    
+    def kill():
+        timed_out.set()
+        _kill(process)
+    
+    killer = threading.Timer(timeout, kill)
+    killer.start()
+    stdout_lines = []
+    finished = False
+    try:
+        for line in process.stdout:
+            stdout_lines.append(line)
+            yield {
+                "tool": "shell",
+                "chunk": line.rstrip("\n"),
+                "stream": "stdout"
+            }
+        process.wait()
+        finished = True
+    finally:
+        killer.cancel()
+        if not finished:
+            # Abandoned mid-stream; background children of the shell must not outlive it
+            _kill(process)
+            process.wait()
+    stderr_reader.join()
+    
+    if timed_out.is_set():
+        yield {
+            "tool": "shell",
+            "error": f"Command timed out after {timeout} seconds"
+        }
+        return
+    
+    stdout = "".join(stdout_lines).strip()
+    stderr = "".join(stderr_lines).strip()
+    yield {
+        "tool": "shell",
+        "command": command,
+        "return_code": process.returncode,
+        "stdout": stdout,
+        "stderr": stderr,
+        "platform": platform.system(),
+        "result": stdout if process.returncode == 0 else f"Error: {stderr}"
+    }
@@ -19,6 +19,8 @@ SCHEMA = {
     "required": ["prompt"]
 }
 
+CACHE = {"ttl": 300, "key": ["prompt", "style"]}
+
 def run(params):
     prompt = params.get("prompt", "")
     if not prompt:
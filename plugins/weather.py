@@ -1,5 +1,13 @@
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from city_index import CityIndex, normalize
+from result_cache import TTLCache
 
 # MCP metadata
 DESCRIPTION = "Get current weather information for a location"
@@ -10,23 +18,64 @@ SCHEMA = {
             "type": "string",
             "description": "The city name to get weather for"
         },
+        "cities": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Several city names to look up at once (instead of 'city')"
+        },
         "units": {
             "type": "string",
             "description": "Temperature units",
             "enum": ["metric", "imperial", "kelvin"],
             "default": "metric"
         }
-    },
-    "required": ["city"]
+    }
 }
 
-def run(params):
+WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+GROUP_URL = "http://api.openweathermap.org/data/2.5/group"
+GROUP_SIZE = 20  # Upstream limit on city IDs per group request
+
+# Pure network I/O: arun keeps many lookups in flight on one event loop
+MAX_CONCURRENCY = int(os.getenv("WEATHER_MAX_CONCURRENCY", "100"))
+
+# Conditions change on a ~10 minute scale. Readings are cached per normalized city in metric
+# units and converted on the way out, so one upstream call answers every unit system.
+# Stale readings of cities that are still being asked for are served while refreshed in the background.
+CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+CACHE_STALE = float(os.getenv("WEATHER_CACHE_STALE", "300"))
+_readings = TTLCache(maxsize=int(os.getenv("WEATHER_CACHE_SIZE", "1024")), ttl=CACHE_TTL)
+_city_ids = {}  # Normalized city -> OpenWeatherMap city ID, from the index or learned from responses
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_background = set()
+
+# Pooled keep-alive connections to OpenWeatherMap, shared by every call in the process
+POOL_SIZE = int(os.getenv("WEATHER_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("WEATHER_READ_TIMEOUT", "10"))
+RETRIES = int(os.getenv("WEATHER_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("WEATHER_RETRY_BACKOFF", "0.5"))
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Optional local city list index (built with city_index.py), mapped lazily on first use
+CITY_INDEX_PATH = os.getenv("WEATHER_CITY_INDEX", "city_index.txt")
+_city_index = None
+_city_index_loaded = False
+_city_index_lock = threading.Lock()
+
+_session = None
+_async_client = None
+_fetch_pool = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="weather")
+
+def _prepare(params):
+    """Return (early_result, city, units, api_key); early_result is set for errors and mock data"""
     city = params.get("city", "")
     if not city:
         return {
             "tool": "weather",
             "error": "Missing 'city' parameter"
-        }
+        }, None, None, None
     
     # Get API key from environment
     api_key = os.getenv("OPENWEATHER_API_KEY")
@@ -36,38 +85,370 @@ def run(params):
             "tool": "weather",
             "city": city,
             "result": f"Mock weather data: The weather in {city} is sunny with 25°C (no API key configured)"
-        }
+        }, None, None, None
     
     units = params.get("units", "metric")
-    
+    return None, city, units, api_key
+
+def _city_key(city):
+    return normalize(city)
+
+def _get_city_index():
+    global _city_index, _city_index_loaded
+    if not _city_index_loaded:
+        with _city_index_lock:
+            if not _city_index_loaded:
+                try:
+                    _city_index = CityIndex(CITY_INDEX_PATH) if os.path.exists(CITY_INDEX_PATH) else None
+                except (OSError, ValueError):
+                    _city_index = None
+                _city_index_loaded = True
+    return _city_index
+
+def _city_id(city):
+    """OpenWeatherMap ID for a city string, resolved without network calls when possible"""
+    key = _city_key(city)
+    if key not in _city_ids:
+        index = _get_city_index()
+        entry = index.resolve(city) if index is not None else None
+        if entry is None:
+            return None
+        _city_ids[key] = entry["id"]
+    return _city_ids[key]
+
+def _reading_key(city):
+    # Spellings that resolve to the same city ID share one cache entry
+    city_id = _city_id(city)
+    return f"id:{city_id}" if city_id else _city_key(city)
+
+def _request_params(city, api_key):
+    # Always fetch metric; other units are derived locally
+    city_id = _city_id(city)
+    return {
+        **({"id": city_id} if city_id else {"q": city}),
+        "appid": api_key,
+        "units": "metric"
+    }
+
+def _parse(response):
+    """Return (data, error_result) for an upstream response"""
+    if response.status_code == 200:
+        return response.json(), None
+    else:
+        return None, {
+            "tool": "weather",
+            "error": f"Weather API error: {response.status_code} - {response.text}"
+        }
+
+def _remember(city, data):
+    """Cache a reading from an upstream weather payload and return it"""
+    reading = {
+        "temperature": data["main"]["temp"],
+        "description": data["weather"][0]["description"],
+        "humidity": data["main"]["humidity"],
+        "pressure": data["main"]["pressure"]
+    }
+    if data.get("id"):
+        _city_ids[_city_key(city)] = data["id"]
+    _readings.set(_reading_key(city), reading)
+    return reading
+
+def _convert(celsius, units):
+    if units == "imperial":
+        return round(celsius * 9 / 5 + 32, 2)
+    if units == "kelvin":
+        return round(celsius + 273.15, 2)
+    return celsius
+
+def _result(city, units, reading, age):
+    temperature = _convert(reading["temperature"], units)
+    return {
+        "tool": "weather",
+        "city": city,
+        "temperature": temperature,
+        "description": reading["description"],
+        "humidity": reading["humidity"],
+        "pressure": reading["pressure"],
+        "units": units,
+        "cache_age": round(age, 1),
+        "result": f"Weather in {city}: {reading['description']}, {temperature}°{'C' if units == 'metric' else 'F' if units == 'imperial' else 'K'}"
+    }
+
+def _error(e):
+    return {
+        "tool": "weather",
+        "error": f"Weather service error: {str(e)}"
+    }
+
+def _get_session():
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=RETRIES,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["GET"],
+            raise_on_status=False
+        )
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry))
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry))
+        _session = session
+    return _session
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        # Pool limits belong on the transport: AsyncClient ignores limits= when given a transport
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+                retries=RETRIES  # Retries failed connects only
+            )
+        )
+    return _async_client
+
+def _get(url, request_params):
+    return _get_session().get(url, params=request_params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+
+async def _aget(url, request_params):
+    """GET with the same 5xx retry and exponential backoff policy as the sync session"""
+    for attempt in range(RETRIES + 1):
+        response = await _get_async_client().get(url, params=request_params)
+        if response.status_code not in RETRY_STATUSES or attempt == RETRIES:
+            return response
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+def _fetch(city, api_key):
+    # Call OpenWeatherMap API
+    data, error = _parse(_get(WEATHER_URL, _request_params(city, api_key)))
+    return (_remember(city, data) if data else None), error
+
+async def _afetch(city, api_key):
+    data, error = _parse(await _aget(WEATHER_URL, _request_params(city, api_key)))
+    return (_remember(city, data) if data else None), error
+
+def _group_params(cities_by_id, api_key):
+    return {
+        "id": ",".join(str(city_id) for city_id in cities_by_id),
+        "appid": api_key,
+        "units": "metric"
+    }
+
+def _group_results(cities_by_id, data, error):
+    """Map a group response back to [(city, reading, error)]"""
+    if error:
+        return [(city, None, error) for city in cities_by_id.values()]
+    results = {}
+    for item in data.get("list", []):
+        city = cities_by_id.get(item.get("id"))
+        if city is not None:
+            results[city] = _remember(city, item)
+    missing = {"tool": "weather", "error": "City missing from group response"}
+    return [(city, results.get(city), None if city in results else missing) for city in cities_by_id.values()]
+
+def _fetch_one(city, api_key):
     try:
-        # Call OpenWeatherMap API
-        url = f"http://api.openweathermap.org/data/2.5/weather"
-        response = requests.get(url, params={
-            "q": city,
-            "appid": api_key,
-            "units": units
-        })
-        
-        if response.status_code == 200:
-            data = response.json()
-            return {
-                "tool": "weather",
-                "city": city,
-                "temperature": data["main"]["temp"],
-                "description": data["weather"][0]["description"],
-                "humidity": data["main"]["humidity"],
-                "pressure": data["main"]["pressure"],
-                "units": units,
-                "result": f"Weather in {city}: {data['weather'][0]['description']}, {data['main']['temp']}°{'C' if units == 'metric' else 'F' if units == 'imperial' else 'K'}"
-            }
-        else:
-            return {
-                "tool": "weather",
-                "error": f"Weather API error: {response.status_code} - {response.text}"
-            }
+        reading, error = _fetch(city, api_key)
+        return [(city, reading, error)]
+    except Exception as e:
+        return [(city, None, _error(e))]
+
+async def _afetch_one(city, api_key):
+    try:
+        reading, error = await _afetch(city, api_key)
+        return [(city, reading, error)]
+    except Exception as e:
+        return [(city, None, _error(e))]
+
+def _fetch_group(cities_by_id, api_key):
+    try:
+        data, error = _parse(_get(GROUP_URL, _group_params(cities_by_id, api_key)))
+        return _group_results(cities_by_id, data, error)
     except Exception as e:
+        return [(city, None, _error(e)) for city in cities_by_id.values()]
+
+async def _afetch_group(cities_by_id, api_key):
+    try:
+        data, error = _parse(await _aget(GROUP_URL, _group_params(cities_by_id, api_key)))
+        return _group_results(cities_by_id, data, error)
+    except Exception as e:
+        return [(city, None, _error(e)) for city in cities_by_id.values()]
+
+def _claim_refresh(city):
+    """Return the cache key to refresh, or None if a refresh for this city is already running"""
+    key = _reading_key(city)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return None
+        _refreshing.add(key)
+        return key
+
+def _refresh(city, api_key, key):
+    try:
+        _fetch(city, api_key)
+    except Exception:
+        pass  # Keep serving the stale reading; the next request retries
+    finally:
+        _refreshing.discard(key)
+
+async def _arefresh(city, api_key, key):
+    try:
+        await _afetch(city, api_key)
+    except Exception:
+        pass
+    finally:
+        _refreshing.discard(key)
+
+def _cached(city):
+    """Return (reading, age, stale) from the cache, or None"""
+    entry = _readings.get_with_age(_reading_key(city), max_stale=CACHE_STALE)
+    if entry is None:
+        return None
+    reading, age = entry
+    return reading, age, age > CACHE_TTL
+
+def _start_refresh(city, api_key):
+    key = _claim_refresh(city)
+    if key is not None:
+        threading.Thread(target=_refresh, args=(city, api_key, key), daemon=True).start()
+
+def _astart_refresh(city, api_key):
+    key = _claim_refresh(city)
+    if key is not None:
+        task = asyncio.ensure_future(_arefresh(city, api_key, key))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+def _prepare_many(params):
+    """Return (early_result, unique cities, units, api_key) for a multi-city request"""
+    cities = params.get("cities")
+    if not isinstance(cities, list) or not cities:
         return {
             "tool": "weather",
-            "error": f"Weather service error: {str(e)}"
-        }
+            "error": "'cities' must be a non-empty list of city names"
+        }, None, None, None
+    
+    # De-duplicate on the resolved city (ID or normalized name), keeping the first spelling
+    unique = {}
+    for city in cities:
+        if isinstance(city, str) and city.strip():
+            unique.setdefault(_reading_key(city), city)
+    
+    api_key = os.getenv("OPENWEATHER_API_KEY")
+    if not api_key:
+        return _many_result(params.get("units", "metric"), [
+            _prepare({"city": city})[0] for city in unique.values()
+        ]), None, None, None
+    return None, list(unique.values()), params.get("units", "metric"), api_key
+
+def _plan_many(cities, units):
+    """Split cities into cached results and the upstream requests still needed.
+
+    Returns (results, groups, names, stale): results maps city -> result dict; groups are
+    {city_id: city} batches for the group endpoint; names must be looked up one by one.
+    """
+    results = {}
+    stale = []
+    by_id = {}
+    names = []
+    for city in cities:
+        cached = _cached(city)
+        if cached is not None:
+            reading, age, is_stale = cached
+            results[city] = _result(city, units, reading, age)
+            if is_stale:
+                stale.append(city)
+        elif _city_id(city):
+            by_id[_city_id(city)] = city
+        else:
+            names.append(city)
+    ids = list(by_id)
+    groups = [{city_id: by_id[city_id] for city_id in ids[i:i + GROUP_SIZE]} for i in range(0, len(ids), GROUP_SIZE)]
+    return results, groups, names, stale
+
+def _many_result(units, results):
+    return {
+        "tool": "weather",
+        "units": units,
+        "count": len(results),
+        "results": results
+    }
+
+def _collect(cities, units, results, fetched):
+    for batch in fetched:
+        for city, reading, error in batch:
+            results[city] = dict(error, city=city) if error else _result(city, units, reading, 0)
+    return _many_result(units, [results[city] for city in cities])
+
+def _run_many(params):
+    result, cities, units, api_key = _prepare_many(params)
+    if result is not None:
+        return result
+    
+    results, groups, names, stale = _plan_many(cities, units)
+    for city in stale:
+        _start_refresh(city, api_key)
+    futures = [_fetch_pool.submit(_fetch_group, group, api_key) for group in groups]
+    futures += [_fetch_pool.submit(_fetch_one, city, api_key) for city in names]
+    return _collect(cities, units, results, [future.result() for future in futures])
+
+async def _arun_many(params):
+    result, cities, units, api_key = _prepare_many(params)
+    if result is not None:
+        return result
+    
+    results, groups, names, stale = _plan_many(cities, units)
+    for city in stale:
+        _astart_refresh(city, api_key)
+    fetched = await asyncio.gather(
+        *[_afetch_group(group, api_key) for group in groups],
+        *[_afetch_one(city, api_key) for city in names]
+    )
+    return _collect(cities, units, results, fetched)
+
+def stats():
+    return {"readings_cache": _readings.stats()}
+
+def run(params):
+    if params.get("cities") is not None:
+        return _run_many(params)
+    
+    result, city, units, api_key = _prepare(params)
+    if result is not None:
+        return result
+    
+    try:
+        cached = _cached(city)
+        if cached is not None:
+            reading, age, stale = cached
+            if stale:
+                _start_refresh(city, api_key)
+            return _result(city, units, reading, age)
+        
+        reading, error = _fetch(city, api_key)
+        return error or _result(city, units, reading, 0)
+    except Exception as e:
+        return _error(e)
+
+async def arun(params):
+    if params.get("cities") is not None:
+        return await _arun_many(params)
+    
+    result, city, units, api_key = _prepare(params)
+    if result is not None:
+        return result
+    
+    try:
+        cached = _cached(city)
+        if cached is not None:
+            reading, age, stale = cached
+            if stale:
+                _astart_refresh(city, api_key)
+            return _result(city, units, reading, age)
+        
+        reading, error = await _afetch(city, api_key)
+        return error or _result(city, units, reading, 0)
+    except Exception as e:
+        return _error(e)
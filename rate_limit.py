@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+class RateLimitExceeded(Exception):
+    """Raised when no quota is available within the allowed waiting time"""
+
+class QuotaScheduler:
+    """Per-name token buckets for requests/minute and tokens/minute plus a daily request budget.
+
+    State lives in sqlite so counters survive restarts and are shared by the Flask app and
+    the MCP server when both point at the same file. ``limits`` maps a name to a dict with
+    ``rpm``, ``tpm`` and ``rpd`` entries; names without limits are never throttled.
+    """
+
+    def __init__(self, limits, path=None):
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota_state (name TEXT PRIMARY KEY, requests REAL NOT NULL, "
+            "tokens REAL NOT NULL, updated REAL NOT NULL, day TEXT NOT NULL, day_count INTEGER NOT NULL)"
+        )
+
+    def _load(self, name, limit, now):
+        """Return (requests, tokens, day, day_count) refilled up to ``now``"""
+        row = self._conn.execute(
+            "SELECT requests, tokens, updated, day, day_count FROM quota_state WHERE name = ?", (name,)
+        ).fetchone()
+        today = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d")
+        if row is None:
+            return limit["rpm"], limit["tpm"], today, 0
+        requests, tokens, updated, day, day_count = row
+        elapsed = max(0.0, now - updated)
+        requests = min(limit["rpm"], requests + elapsed * limit["rpm"] / 60)
+        tokens = min(limit["tpm"], tokens + elapsed * limit["tpm"] / 60)
+        if day != today:
+            day, day_count = today, 0
+        return requests, tokens, day, day_count
+
+    def _save(self, name, now, requests, tokens, day, day_count):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO quota_state (name, requests, tokens, updated, day, day_count) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, requests, tokens, now, day, day_count)
+        )
+
+    @staticmethod
+    def _wait(limit, requests, tokens, day_count, cost, now):
+        if day_count >= limit["rpd"]:
+            tomorrow = datetime.fromtimestamp(now, timezone.utc).date() + timedelta(days=1)
+            return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=timezone.utc).timestamp() - now
+        waits = [0.0]
+        if requests < 1:
+            waits.append((1 - requests) * 60 / limit["rpm"])
+        if tokens < cost:
+            waits.append((cost - tokens) * 60 / limit["tpm"])
+        return max(waits)
+
+    def reserve(self, name, cost=0):
+        """Consume one request and ``cost`` tokens; return 0 on success, else seconds until they are available"""
+        limit = self.limits.get(name)
+        if limit is None:
+            return 0
+        cost = min(cost, limit["tpm"])
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                requests, tokens, day, day_count = self._load(name, limit, now)
+                wait = self._wait(limit, requests, tokens, day_count, cost, now)
+                if wait == 0:
+                    requests, tokens, day_count = requests - 1, tokens - cost, day_count + 1
+                self._save(name, now, requests, tokens, day, day_count)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def order(self, names, cost=0):
+        """Sort names by how soon they can serve a call, preserving preference order among ties.
+
+        Names whose daily budget is used up are dropped.
+        """
+        now = time.time()
+        waits = {}
+        with self._lock:
+            for name in names:
+                limit = self.limits.get(name)
+                if limit is None:
+                    waits[name] = 0
+                    continue
+                requests, tokens, day, day_count = self._load(name, limit, now)
+                if day_count >= limit["rpd"]:
+                    continue
+                waits[name] = self._wait(limit, requests, tokens, day_count, min(cost, limit["tpm"]), now)
+        return sorted(waits, key=lambda name: (waits[name] > 0, waits[name]))
+
+    def penalize(self, name):
+        """Empty a request bucket after the upstream reported a rate limit"""
+        limit = self.limits.get(name)
+        if limit is None:
+            return
+        with self._lock:
+            now = time.time()
+            requests, tokens, day, day_count = self._load(name, limit, now)
+            self._save(name, now, 0, tokens, day, day_count)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            result = {}
+            for name, limit in self.limits.items():
+                requests, tokens, day, day_count = self._load(name, limit, now)
+                result[name] = {
+                    "requests_available": int(requests),
+                    "tokens_available": int(tokens),
+                    "requests_today": day_count,
+                    "daily_budget": limit["rpd"]
+                }
+            return result
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+def make_key(*parts):
+    """Stable hash of JSON-serializable request parts"""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _size_of(value):
+    return len(json.dumps(value, default=str))
+
+class TTLCache:
+    """Thread-safe in-memory LRU with a per-entry TTL and optional total size bound"""
+
+    def __init__(self, maxsize=1024, ttl=300, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, ttl, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        entry = self.get_with_age(key)
+        return default if entry is None else entry[0]
+
+    def get_with_age(self, key, max_stale=0):
+        """Return (value, age_seconds) for entries up to ``max_stale`` seconds past their TTL, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry[0] if entry is not None else None
+            if entry is None or age > entry[1] + max_stale:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3], age
+
+    def set(self, key, value, ttl=None):
+        size = _size_of(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), self.ttl if ttl is None else ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.maxsize or (self.max_bytes and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None
+            }
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+class DiskCache:
+    """SQLite-backed JSON cache used as a persistent second tier behind TTLCache.
+
+    With ``max_bytes`` set, the oldest entries are dropped once the stored values exceed it.
+    """
+
+    def __init__(self, path, ttl=86400, table="cache", max_bytes=None):
+        self.ttl = ttl
+        self.table = table
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), now)
+            )
+            self._conn.execute(f"DELETE FROM {self.table} WHERE stored_at < ?", (now - self.ttl,))
+            if self.max_bytes:
+                # Keep the newest entries whose sizes add up to at most max_bytes
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM ("
+                    f"SELECT key, SUM(length(CAST(value AS BLOB))) OVER (ORDER BY stored_at DESC, key) AS newer "
+                    f"FROM {self.table}) WHERE newer > ?)",
+                    (self.max_bytes,)
+                )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
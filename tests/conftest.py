@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# Keep the suite away from the committed mcp.db and quota state; set before any plugin imports them
+_scratch = tempfile.mkdtemp(prefix="mcp-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'mcp.db')}")
+os.environ.setdefault("GEMINI_QUOTA_DB", os.path.join(_scratch, "gemini_quota.db"))
+os.environ.setdefault("PLUGIN_HOT_RELOAD", "0")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The plugin registry resolves plugins/ relative to the working directory
+os.chdir(ROOT)
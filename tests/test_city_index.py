@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from city_index import CityIndex, build_index, normalize
+
+CITIES = [
+    {"id": 1, "name": "London", "country": "GB", "coord": {"lat": 51.5, "lon": -0.13}},
+    {"id": 2, "name": "London", "country": "CA", "coord": {"lat": 42.98, "lon": -81.23}},
+    {"id": 3, "name": "São Paulo", "country": "BR", "coord": {"lat": -23.55, "lon": -46.64}},
+    {"id": 4, "name": "Londonderry", "country": "GB", "coord": {"lat": 55.0, "lon": -7.32}},
+    {"id": 5, "name": "Aachen", "country": "DE", "coord": {"lat": 50.78, "lon": 6.08}},
+    {"id": 6, "name": "Zürich", "country": "CH", "coord": {"lat": 47.37, "lon": 8.54}},
+]
+
+@pytest.fixture
+def index(tmp_path):
+    source = tmp_path / "city.list.json"
+    source.write_text(json.dumps(CITIES), encoding="utf-8")
+    target = tmp_path / "city_index.txt"
+    assert build_index(str(source), str(target)) == len(CITIES)
+    index = CityIndex(str(target))
+    yield index
+    index.close()
+
+def _line_at(index, offset):
+    return bytes(index._map[offset:index._map.find(b"\n", offset)])
+
+def test_first_at_or_after(index):
+    lines = bytes(index._map).split(b"\n")[:-1]
+    assert lines == sorted(lines)
+    # Every line is found at its own offset, and a key just past it lands on the next line
+    offset = 0
+    for i, line in enumerate(lines):
+        assert index._first_at_or_after(line) == offset
+        after = index._first_at_or_after(line + b"\xff")
+        assert after == offset + len(line) + 1
+        if i + 1 < len(lines):
+            assert _line_at(index, after) == lines[i + 1]
+        offset += len(line) + 1
+    assert index._first_at_or_after(b"") == 0
+    assert index._first_at_or_after(b"\xff") == len(index._map)
+
+def test_lookup_filters_by_country(index):
+    assert sorted(city["id"] for city in index.lookup("London")) == [1, 2]
+    assert [city["id"] for city in index.lookup("london, gb")] == [1]
+    assert index.lookup("London,FR") == []
+
+def test_resolve_needs_a_single_match(index):
+    assert index.resolve("London") is None
+    assert index.resolve("London,CA")["id"] == 2
+    assert index.resolve("sao paulo")["name"] == "São Paulo"
+    assert index.resolve("Nowhere") is None
+
+def test_search_by_prefix_and_country(index):
+    assert [city["id"] for city in index.search("lond")] == [2, 1, 4]
+    assert [city["id"] for city in index.search("lond,GB")] == [1, 4]
+    assert [city["id"] for city in index.search("lond,GB", limit=1)] == [1]
+    assert [city["id"] for city in index.search("zur")] == [6]
+
+def test_normalize():
+    assert normalize("  São   PAULO ") == "sao paulo"
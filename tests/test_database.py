@@ -0,0 +1,75 @@
+import importlib
+import sqlite3
+import sys
+
+import pytest
+from sqlalchemy import text
+
+@pytest.fixture
+def load_database(tmp_path, monkeypatch):
+    """Import database.py against a throwaway sqlite file"""
+    path = tmp_path / "test.db"
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{path}")
+    loaded = []
+
+    def load():
+        sys.modules.pop("database", None)
+        module = importlib.import_module("database")
+        loaded.append(module)
+        return module
+
+    yield path, load
+    for module in loaded:
+        module.engine.dispose()
+    sys.modules.pop("database", None)
+
+def _plan(engine, sql, **params):
+    with engine.connect() as conn:
+        return " | ".join(row[3] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params))
+
+def test_key_query_uses_index(load_database):
+    _, load = load_database
+    database = load()
+    plan = _plan(database.engine, "SELECT id, key, value FROM records WHERE key = :key ORDER BY id", key="a")
+    assert "USING INDEX ix_records_key" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_existing_database_gets_index(load_database):
+    path, load = load_database
+    # A database created before the index existed
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE records (id INTEGER PRIMARY KEY, key VARCHAR, value VARCHAR)")
+    conn.execute("INSERT INTO records (key, value) VALUES ('a', '1')")
+    conn.commit()
+    conn.close()
+
+    database = load()
+    plan = _plan(database.engine, "SELECT id, key, value FROM records WHERE key = :key ORDER BY id", key="a")
+    assert "USING INDEX ix_records_key" in plan
+    with database.engine.connect() as conn:
+        assert conn.execute(text("SELECT value FROM records WHERE key = 'a'")).scalar() == "1"
+
+def _index_names(engine):
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'records'"))}
+
+def test_unique_keys_replaces_plain_index(load_database, monkeypatch):
+    _, load = load_database
+    load().engine.dispose()
+    monkeypatch.setenv("DB_UNIQUE_KEYS", "1")
+    database = load()
+    assert database.UNIQUE_KEYS
+    assert {"ux_records_key", "ix_records_key"} & _index_names(database.engine) == {"ux_records_key"}
+
+def test_unique_keys_with_duplicates_falls_back(load_database, monkeypatch):
+    path, load = load_database
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE records (id INTEGER PRIMARY KEY, key VARCHAR, value VARCHAR)")
+    conn.executemany("INSERT INTO records (key, value) VALUES (?, ?)", [("a", "1"), ("a", "2")])
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setenv("DB_UNIQUE_KEYS", "1")
+    database = load()
+    assert not database.UNIQUE_KEYS
+    assert {"ux_records_key", "ix_records_key"} & _index_names(database.engine) == {"ix_records_key"}
@@ -0,0 +1,166 @@
+import importlib
+import sqlite3
+import sys
+import uuid
+
+import pytest
+
+import plugins
+from plugins import db
+
+needs_version_conn = pytest.mark.skipif(db._version_conn is None, reason="read cache needs a SQLite file database")
+
+@pytest.fixture
+def key():
+    return f"k-{uuid.uuid4().hex}"
+
+@pytest.fixture
+def unique_db(tmp_path, monkeypatch):
+    """plugins.db imported fresh against a throwaway database with DB_UNIQUE_KEYS=1"""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'unique.db'}")
+    monkeypatch.setenv("DB_UNIQUE_KEYS", "1")
+    saved = {name: sys.modules.pop(name, None) for name in ("database", "plugins.db")}
+    monkeypatch.setattr(plugins, "db", None)
+    module = importlib.import_module("plugins.db")
+    yield module
+    if module._version_conn is not None:
+        module._version_conn.close()
+    module.engine.dispose()
+    for name, saved_module in saved.items():
+        if saved_module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = saved_module
+
+def _other_process_update(key, value):
+    conn = sqlite3.connect(db.engine.url.database)
+    with conn:
+        conn.execute("UPDATE records SET value = ? WHERE key = ?", (value, key))
+    conn.close()
+
+def _values(key):
+    return [row["value"] for row in db.run({"action": "query", "key": key})["results"]]
+
+@needs_version_conn
+def test_local_write_drops_only_its_key(key):
+    other = key + "-other"
+    db.run({"action": "insert", "key": key, "value": "a"})
+    db.run({"action": "insert", "key": other, "value": "b"})
+    assert _values(key) == ["a"] and _values(other) == ["b"]
+    hits = db.stats()["query_cache"]["hits"]
+    db.run({"action": "insert", "key": key, "value": "c"})
+    assert _values(other) == ["b"]
+    assert db.stats()["query_cache"]["hits"] == hits + 1
+    assert _values(key) == ["a", "c"]
+
+@needs_version_conn
+def test_other_process_commit_clears_cache(key, monkeypatch):
+    monkeypatch.setattr(db, "READ_CACHE_CHECK_INTERVAL", 0)
+    db.run({"action": "insert", "key": key, "value": "old"})
+    assert _values(key) == ["old"]
+    _other_process_update(key, "new")
+    assert _values(key) == ["new"]
+
+@needs_version_conn
+def test_commit_right_after_ours_is_not_absorbed(key, monkeypatch):
+    db.run({"action": "insert", "key": key, "value": "old"})
+    assert _values(key) == ["old"]
+
+    # Another process commits between our commit and the data_version re-read that follows it
+    class CommitBeforeSecondRead:
+        def __init__(self, conn):
+            self.conn, self.reads = conn, 0
+
+        def execute(self, sql):
+            self.reads += 1
+            if self.reads == 2:
+                _other_process_update(key, "new")
+            return self.conn.execute(sql)
+
+    monkeypatch.setattr(db, "_version_conn", CommitBeforeSecondRead(db._version_conn))
+    db.run({"action": "insert", "key": key + "-other", "value": "x"})
+    assert db._version_conn.reads == 2
+    monkeypatch.undo()
+
+    assert _values(key) == ["new"]
+
+def test_insert_many_returns_ids_in_input_order(key):
+    records = [{"key": f"{key}-{i % 3}", "value": str(i)} for i in range(1200)]
+    result = db.run({"action": "insert_many", "records": records})
+    assert result["count"] == len(records)
+    ids = result["ids"]
+    assert len(set(ids)) == len(ids)
+    listed = db.run({"action": "query_many", "keys": [f"{key}-{i}" for i in range(3)]})["results"]
+    by_id = {row["id"]: row["value"] for rows in listed.values() for row in rows}
+    assert [by_id[record_id] for record_id in ids] == [record["value"] for record in records]
+
+def test_query_many_and_delete_many(key):
+    ids = db.run({"action": "insert_many", "records": [{"key": key, "value": "a"}, {"key": key, "value": "b"}]})["ids"]
+    result = db.run({"action": "query_many", "keys": [key, key + "-missing"]})
+    assert [row["id"] for row in result["results"][key]] == ids
+    assert result["results"][key + "-missing"] == []
+    result = db.run({"action": "delete_many", "ids": ids + [-1]})
+    assert result["deleted_ids"] == sorted(ids) and result["not_found"] == [-1]
+    assert _values(key) == []
+
+def test_insert_many_rejects_incomplete_records(key):
+    result = db.run({"action": "insert_many", "records": [{"key": key, "value": "a"}, {"key": key}]})
+    assert "error" in result
+    assert _values(key) == []
+
+def test_cas_and_upsert_need_unique_keys(key):
+    assert not db.UNIQUE_KEYS
+    assert "DB_UNIQUE_KEYS=1" in db.run({"action": "upsert", "key": key, "value": "a"})["error"]
+
+def test_upsert_bumps_version(unique_db):
+    first = unique_db.run({"action": "upsert", "key": "k", "value": "a"})
+    second = unique_db.run({"action": "upsert", "key": "k", "value": "b"})
+    assert (first["version"], second["version"]) == (1, 2)
+    assert first["id"] == second["id"]
+    assert [(r["value"], r["version"]) for r in unique_db.run({"action": "query", "key": "k"})["results"]] == [("b", 2)]
+
+def test_cas_conflicts(unique_db):
+    created = unique_db.run({"action": "cas", "key": "k", "value": "a", "expected_version": 0})
+    assert created["status"] == "success" and created["version"] == 1
+    # Creating again, or updating from a stale version, reports the current version instead of writing
+    again = unique_db.run({"action": "cas", "key": "k", "value": "b", "expected_version": 0})
+    assert again["status"] == "conflict" and again["current_version"] == 1
+    updated = unique_db.run({"action": "cas", "key": "k", "value": "b", "expected_version": 1})
+    assert updated["status"] == "success" and updated["version"] == 2
+    stale = unique_db.run({"action": "cas", "key": "k", "value": "c", "expected_version": 1})
+    assert stale["status"] == "conflict" and stale["current_version"] == 2
+    missing = unique_db.run({"action": "cas", "key": "other", "value": "c", "expected_version": 3})
+    assert missing["status"] == "conflict" and missing["current_version"] == 0
+    assert [r["value"] for r in unique_db.run({"action": "query", "key": "k"})["results"]] == ["b"]
+
+def _search_ids(module, query, **params):
+    return [row["id"] for row in module.run(dict(params, action="search", query=query))["results"]]
+
+def test_search_prefix_and_quoting(unique_db):
+    ids = unique_db.run({"action": "insert_many", "records": [
+        {"key": "a", "value": "quick brown fox"},
+        {"key": "b", "value": "quickly done"},
+        {"key": "c", "value": 'say "hi" (fox)'},
+    ]})["ids"]
+    assert _search_ids(unique_db, "quick") == [ids[0]]
+    assert sorted(_search_ids(unique_db, "quick", prefix=True)) == ids[:2]
+    assert sorted(_search_ids(unique_db, "fox")) == [ids[0], ids[2]]
+    # Terms are ANDed, and FTS5 syntax characters are matched as text
+    assert _search_ids(unique_db, "brown fox") == [ids[0]]
+    assert _search_ids(unique_db, '"hi" (fox') == [ids[2]]
+    assert _search_ids(unique_db, "fox", limit=1) in ([ids[0]], [ids[2]])
+
+def test_search_follows_upsert_cas_and_delete(unique_db):
+    record_id = unique_db.run({"action": "upsert", "key": "k", "value": "alpha"})["id"]
+    assert _search_ids(unique_db, "alpha") == [record_id]
+    unique_db.run({"action": "upsert", "key": "k", "value": "beta"})
+    assert _search_ids(unique_db, "alpha") == []
+    assert _search_ids(unique_db, "beta") == [record_id]
+    unique_db.run({"action": "cas", "key": "k", "value": "gamma", "expected_version": 2})
+    assert _search_ids(unique_db, "beta") == []
+    assert _search_ids(unique_db, "gamma") == [record_id]
+    # A cas conflict leaves the index untouched
+    unique_db.run({"action": "cas", "key": "k", "value": "delta", "expected_version": 2})
+    assert _search_ids(unique_db, "delta") == []
+    unique_db.run({"action": "delete", "id": record_id})
+    assert _search_ids(unique_db, "gamma") == []
@@ -0,0 +1,153 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+import dispatcher
+from plugins import db
+
+def _fake_plugin(monkeypatch, **attrs):
+    """Register a throwaway 'fake' tool whose run() records its calls"""
+    calls = []
+    def run(params):
+        calls.append(params)
+        time.sleep(0.1)
+        return {"tool": "fake", "n": len(calls)}
+    module = types.ModuleType("fake")
+    module.run = run
+    for name, value in attrs.items():
+        setattr(module, name, value)
+    monkeypatch.setattr(dispatcher, "get_plugin", lambda tool_name: {"module": module} if tool_name == "fake" else None)
+    return calls
+
+def _run_concurrently(*params):
+    async def gather():
+        return await asyncio.gather(*(dispatcher.run_tool("fake", p) for p in params))
+    return dispatcher.submit(gather()).result()
+
+def test_identical_concurrent_calls_share_one_run(monkeypatch):
+    calls = _fake_plugin(monkeypatch)
+    coalesced = dispatcher.stats()["coalesced"]
+    results = _run_concurrently(*[{"x": 1}] * 5)
+    assert len(calls) == 1
+    assert results == [{"tool": "fake", "n": 1}] * 5
+    assert dispatcher.stats()["coalesced"] == coalesced + 4
+    # Different params are separate calls, and a finished call is not reused
+    _run_concurrently({"x": 1}, {"x": 2})
+    assert len(calls) == 3
+
+def test_single_flight_disabled(monkeypatch):
+    calls = _fake_plugin(monkeypatch, SINGLE_FLIGHT=False)
+    _run_concurrently(*[{"x": 1}] * 3)
+    assert len(calls) == 3
+
+def test_single_flight_predicate(monkeypatch):
+    calls = _fake_plugin(monkeypatch, SINGLE_FLIGHT=lambda params: params["action"] == "read")
+    _run_concurrently(*[{"action": "read"}] * 3)
+    assert len(calls) == 1
+    _run_concurrently(*[{"action": "write"}] * 3)
+    assert len(calls) == 4
+
+CACHE = {"ttl": 0.5, "key": ["x"], "stale_while_revalidate": 5}
+
+def _call(params):
+    return dispatcher.run_tool_sync("fake", params)
+
+def test_cache_serves_hits_by_declared_key(monkeypatch):
+    calls = _fake_plugin(monkeypatch, CACHE=CACHE)
+    assert _call({"x": 1}) == {"tool": "fake", "n": 1}
+    assert _call({"x": 1, "ignored": True}) == {"tool": "fake", "n": 1}
+    assert _call({"x": 2}) == {"tool": "fake", "n": 2}
+    assert len(calls) == 2
+
+def test_cache_serves_stale_while_revalidating(monkeypatch):
+    calls = _fake_plugin(monkeypatch, CACHE=CACHE)
+    _call({"x": 1})
+    time.sleep(0.6)
+    started = time.monotonic()
+    # Past the TTL: the stale result comes back without waiting for run()
+    assert _call({"x": 1}) == {"tool": "fake", "n": 1}
+    assert time.monotonic() - started < 0.1
+    time.sleep(0.25)
+    assert len(calls) == 2
+    assert _call({"x": 1}) == {"tool": "fake", "n": 2}
+
+def test_cache_skips_errors(monkeypatch):
+    calls = _fake_plugin(monkeypatch, CACHE=CACHE)
+    module = dispatcher.get_plugin("fake")["module"]
+    module.run = lambda params: calls.append(params) or {"tool": "fake", "error": "boom"}
+    _call({"x": 1})
+    _call({"x": 1})
+    assert len(calls) == 2
+
+def test_reloaded_plugin_starts_with_empty_cache(monkeypatch):
+    _fake_plugin(monkeypatch, CACHE=CACHE)
+    _call({"x": 1})
+    calls = _fake_plugin(monkeypatch, CACHE=CACHE)
+    _call({"x": 1})
+    assert len(calls) == 1
+
+def test_reloaded_plugin_does_not_join_old_call(monkeypatch):
+    _fake_plugin(monkeypatch)
+    old_call = dispatcher.submit(dispatcher.run_tool("fake", {"x": 1}))
+    time.sleep(0.02)
+    calls = _fake_plugin(monkeypatch)
+    assert _call({"x": 1}) == {"tool": "fake", "n": 1}
+    assert len(calls) == 1
+    old_call.result()
+
+def test_db_coalesces_reads_only():
+    for action in ("query", "list_all", "query_many", "search"):
+        assert db.SINGLE_FLIGHT({"action": action})
+    for action in ("insert", "delete", "insert_many", "delete_many", "upsert", "cas"):
+        assert not db.SINGLE_FLIGHT({"action": action})
+
+def _counting(produced, count=1000):
+    async def gen():
+        try:
+            for i in range(count):
+                produced.append(i)
+                yield i
+                await asyncio.sleep(0)
+        finally:
+            produced.append("closed")
+    return gen()
+
+def test_iterate_sync_yields_all_items():
+    assert list(dispatcher.iterate_sync(_counting([], 100))) == list(range(100))
+
+def test_iterate_sync_bounds_buffer_and_closes(monkeypatch):
+    # The handoff must not borrow a plugin worker thread
+    monkeypatch.setattr(dispatcher, "_get_executor", lambda kind: pytest.fail("executor used"))
+    produced = []
+    items = dispatcher.iterate_sync(_counting(produced))
+    assert next(items) == 0
+    time.sleep(0.2)
+    assert len(produced) <= dispatcher.STREAM_BUFFER + 2
+    items.close()
+    deadline = time.monotonic() + 2
+    while "closed" not in produced and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert produced[-1] == "closed"
+
+def test_iterate_sync_raises_producer_error():
+    async def failing():
+        yield 1
+        raise ValueError("boom")
+    items = dispatcher.iterate_sync(failing())
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="boom"):
+        next(items)
+
+def _collect(async_iterable):
+    return list(dispatcher.iterate_sync(async_iterable))
+
+def test_db_stream_summary_only_for_exports():
+    assert dispatcher.run_tool_sync("db", {"action": "insert_many", "records": [{"key": "s", "value": str(i)} for i in range(3)]})["count"] == 3
+    params = {"action": "list_all", "limit": 2}
+    # Non-export streaming callers (SSE, MCP progress) get the paged run() result
+    assert _collect(dispatcher.stream_tool("db", params)) == [dispatcher.run_tool_sync("db", params)]
+    *chunks, summary = _collect(dispatcher.stream_tool("db", params, export=True))
+    assert [len(c["chunk"]) for c in chunks] == [2]
+    assert summary["count"] == 2 and "records" not in summary
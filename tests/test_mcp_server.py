@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+import anyio
+from mcp import types
+from mcp.shared.memory import create_connected_server_and_client_session
+
+import mcp_server
+
+async def _call(arguments, progress_token=None):
+    """Call the shell tool over an in-memory MCP session; returns (result, notifications)"""
+    notifications = []
+    async with create_connected_server_and_client_session(mcp_server.app) as client:
+        async def collect():
+            async for message in client.incoming_messages:
+                if isinstance(message, types.ServerNotification):
+                    notifications.append(message.root)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(collect)
+            params = {"name": "shell", "arguments": arguments}
+            if progress_token is not None:
+                params["_meta"] = {"progressToken": progress_token}
+            result = await client.send_request(
+                types.ClientRequest(types.CallToolRequest(
+                    method="tools/call",
+                    params=types.CallToolRequestParams.model_validate(params)
+                )),
+                types.CallToolResult
+            )
+            tg.cancel_scope.cancel()
+    return json.loads(result.content[0].text), notifications
+
+def test_progress_token_streams_chunks():
+    result, notifications = asyncio.run(_call({"command": "echo one; echo two"}, progress_token="p1"))
+    assert result["stdout"] == "one\ntwo"
+    progress = [n for n in notifications if isinstance(n, types.ProgressNotification)]
+    logs = [n for n in notifications if isinstance(n, types.LoggingMessageNotification)]
+    assert [n.params.progressToken for n in progress] == ["p1", "p1"]
+    assert [n.params.progress for n in progress] == [1, 2]
+    assert [n.params.data["chunk"] for n in logs] == ["one", "two"]
+
+def test_without_progress_token_no_notifications():
+    result, notifications = asyncio.run(_call({"command": "echo one"}))
+    assert result["stdout"] == "one"
+    assert notifications == []
@@ -0,0 +1,19 @@
+import pytest
+
+import plugin_registry
+
+def test_load_plugin_module_imports_a_fresh_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(plugin_registry, "PLUGINS_DIR", str(tmp_path))
+    (tmp_path / "echo.py").write_text("def run(params):\n    return params\n")
+    first = plugin_registry.load_plugin_module("echo")
+    assert first.run({"a": 1}) == {"a": 1}
+    assert plugin_registry.load_plugin_module("echo") is not first
+
+def test_load_plugin_module_validates(tmp_path, monkeypatch):
+    monkeypatch.setattr(plugin_registry, "PLUGINS_DIR", str(tmp_path))
+    (tmp_path / "norun.py").write_text("SCHEMA = {}\n")
+    (tmp_path / "badschema.py").write_text("SCHEMA = []\ndef run(params):\n    return {}\n")
+    with pytest.raises(ValueError, match="run"):
+        plugin_registry.load_plugin_module("norun")
+    with pytest.raises(ValueError, match="SCHEMA"):
+        plugin_registry.load_plugin_module("badschema")
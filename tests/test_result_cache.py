@@ -0,0 +1,25 @@
+from result_cache import DiskCache
+
+def test_disk_cache_drops_oldest_past_max_bytes(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("result_cache.time.time", lambda: now[0])
+    cache = DiskCache(str(tmp_path / "cache.db"), ttl=3600, max_bytes=250)
+    for key in "abc":
+        now[0] += 1
+        cache.set(key, "x" * 100)
+    # Each value is 102 bytes of JSON, so only the two newest fit
+    assert cache.get("a") is None
+    assert cache.get("b") == cache.get("c") == "x" * 100
+    now[0] += 1
+    cache.set("d", "y" * 300)
+    assert [cache.get(key) for key in "bcd"] == [None, None, None]
+
+def test_disk_cache_expires_and_survives_reopen(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("result_cache.time.time", lambda: now[0])
+    path = str(tmp_path / "cache.db")
+    DiskCache(path, ttl=10).set("k", {"v": 1})
+    reopened = DiskCache(path, ttl=10)
+    assert reopened.get("k") == {"v": 1}
+    now[0] += 11
+    assert reopened.get("k") is None
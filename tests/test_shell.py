@@ -0,0 +1,35 @@
+import os
+import time
+
+import pytest
+
+import dispatcher
+from plugins import shell
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A killed child of ours stays a zombie until reaped
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().split(")")[-1].split()[0] != "Z"
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="process groups are POSIX-only")
+def test_closed_stream_kills_background_children():
+    events = dispatcher.iterate_sync(dispatcher.stream_tool("shell", {"command": "sleep 30 & echo $!; sleep 30"}))
+    child = int(next(events)["chunk"])
+    assert _alive(child)
+    # The worker is now blocked reading stdout; closing must not wait for the command to finish
+    started = time.monotonic()
+    events.close()
+    while _alive(child) and time.monotonic() - started < 5:
+        time.sleep(0.05)
+    assert not _alive(child)
+    assert time.monotonic() - started < 5
+
+def test_stream_result_matches_run():
+    params = {"command": "echo one; echo two"}
+    *chunks, result = list(shell.stream(params))
+    assert [c["chunk"] for c in chunks] == ["one", "two"]
+    assert result == shell.run(params)